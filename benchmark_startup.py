@@ -0,0 +1,89 @@
+#!/usr/bin/python3
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+# Each snippet runs in a fresh interpreter and prints the seconds it took
+SNIPPETS = (
+    ("import solver",
+     "import time\n"
+     "start = time.perf_counter()\n"
+     "import solver\n"
+     "print(time.perf_counter() - start)\n"),
+    ("import + first score",
+     "import time\n"
+     "start = time.perf_counter()\n"
+     "import solver, data, util\n"
+     "util.check_key({}, data.WORD_SET, data.SAMPLE_KEY)\n"
+     "print(time.perf_counter() - start)\n"),
+    ("solver.py -e",
+     None),
+)
+# Modules that are slow to import and shouldn't be needed to start up
+HEAVY_MODULES = ("cv2", "render")
+
+
+def run(snippet):
+    """
+    Run a snippet (or solver.py -e if it's None) in a new process.
+
+    Returns:
+        float, seconds reported by the snippet, or the wall time of the whole
+        process for solver.py
+    """
+    directory = os.path.dirname(os.path.abspath(__file__))
+    if snippet is None:
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "solver.py", "-e", "-n", "1"],
+                       cwd=directory, check=False,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return time.perf_counter() - start
+    output = subprocess.run([sys.executable, "-c", snippet], cwd=directory,
+                            check=True, capture_output=True, text=True).stdout
+    return float(output)
+
+
+def heavy_imports():
+    """Return the HEAVY_MODULES that importing solver pulls in."""
+    snippet = ("import sys, solver\n"
+               "print(' '.join(name for name in {} if name in sys.modules))"
+               .format(HEAVY_MODULES))
+    directory = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.run([sys.executable, "-c", snippet], cwd=directory,
+                          check=True, capture_output=True,
+                          text=True).stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Report how long solver.py takes to start up, so that"
+                    " import time regressions are visible",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("-r", "--repeat",
+                        help="Number of fresh processes to time per"
+                             " measurement",
+                        type=int,
+                        default=5)
+    args = parser.parse_args()
+
+    # Make sure the dictionary cache exists, so we time the warm path
+    run(SNIPPETS[1][1])
+
+    for name, snippet in SNIPPETS:
+        times = [run(snippet) for _ in range(args.repeat)]
+        print("{:<22} median {:.3f}s  min {:.3f}s".format(
+            name, statistics.median(times), min(times)
+        ))
+    print("Heavy modules imported by solver: {}".format(
+        ", ".join(heavy_imports()) or "none"
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+import re
+import string
+
+import data
+
+
+# Packed keys are indexed directly by cipher character, so they need to be
+# wide enough for the largest unknown character (33). It's also the record
+# width of the files in store.py, so it's fixed rather than worked out from
+# data.UNKNOWN, which test_codec checks it covers
+KEY_WIDTH = 34
+# Value stored in a packed key for cipher characters the key doesn't map
+UNMAPPED = 255
+# Letters are stored in packed keys as their index into the alphabet
+LETTER_INDEX = {letter: i for i, letter in enumerate(string.ascii_lowercase)}
+# A single (cipher character, letter) pair in the str(key) form
+PAIR_PATTERN = re.compile(r"\(\s*(\d+)\s*,\s*['\"]([a-z])['\"]\s*\)")
+
+_EMPTY = bytes([UNMAPPED]) * KEY_WIDTH
+
+
+def _rank():
+    """
+    Position of each cipher character in data.SET_FREQ_LIST, which is the
+    order pairs appear in within a key. Replaces data.SET_FREQ_LIST.index,
+    which is a linear scan per lookup.
+    """
+    return {character: i for i, character in enumerate(data.SET_FREQ_LIST)}
+
+
+def _order():
+    """
+    Every cipher character a packed key can hold, in key order. Characters
+    that aren't in data.SET_FREQ_LIST go at the end, in numerical order.
+    """
+    rank = _derived("RANK")
+    return tuple(sorted(range(KEY_WIDTH),
+                        key=lambda character: (rank.get(character, KEY_WIDTH),
+                                               character)))
+
+
+# Values built from data.SET_FREQ_LIST on first use, like data._DERIVED, so
+# importing codec doesn't work out the cipher statistics
+_DERIVED = {
+    "RANK": _rank,
+    "ORDER": _order,
+}
+
+
+def _derived(name):
+    """Get one of the _DERIVED values, computing it on first use."""
+    if name not in globals():
+        globals()[name] = _DERIVED[name]()
+    return globals()[name]
+
+
+def __getattr__(name):
+    if name in _DERIVED:
+        return _derived(name)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def pack(key):
+    """
+    Convert a key into its compact canonical form, KEY_WIDTH bytes where
+    byte i is the letter index cipher character i maps to, or UNMAPPED. Two
+    keys with the same pairs pack the same way no matter what order the pairs
+    are in, and the result hashes far faster than the tuple form.
+
+    Arguments:
+        key: a key as a tuple of (cipher character, ascii letter) pairs, in
+            the str(key) form, or already packed
+
+    Returns:
+        bytes of length KEY_WIDTH
+    """
+    if isinstance(key, bytes):
+        return key
+    if isinstance(key, str):
+        key = from_string(key)
+    packed = bytearray(_EMPTY)
+    for character, letter in key:
+        packed[character] = LETTER_INDEX[letter]
+    return bytes(packed)
+
+
+def unpack(packed):
+    """
+    Inverse of pack. Pairs come out in data.SET_FREQ_LIST order, same as
+    util.generate_random_key produces them.
+    """
+    return tuple((character, string.ascii_lowercase[packed[character]])
+                 for character in _derived("ORDER")
+                 if packed[character] != UNMAPPED)
+
+
+def from_string(text):
+    """
+    Parse a key from the str(key) form (as stored in
+    checked_keys_dictionary.json). Much faster than ast.literal_eval, and
+    keeps the pairs in the order they were written.
+    """
+    return tuple((int(character), letter)
+                 for character, letter in PAIR_PATTERN.findall(text))
+
+
+def to_string(key):
+    """Convert a packed or tuple key into the str(key) form."""
+    if isinstance(key, bytes):
+        key = unpack(key)
+    return str(key)
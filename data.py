@@ -1,6 +1,7 @@
 #!/usr/bin/python3
 
 import collections
+import os
 
 
 # Best key so far:
@@ -9,8 +10,13 @@ import collections
 PRESUMED_ANSWER = ((4, "e"), (16, "s"), (2, "a"), (14, "i"), (1, "t"), (8, "o"), (5, "n"), (9, "r"), (10, "l"), (6, "d"), (7, "c"), (19, "u"), (12, "h"), (15, "b"), (21, "y"), (3, "m"), (13, "g"), (11, "f"), (29, "v"), (20, "p"), (17, "w"), (18, "k"), (24, "q"), (33, "j"))
 
 
-with open("/usr/share/dict/words") as word_file:
-    _english = set(word.strip().lower() for word in word_file)
+# Source of English words
+DICTIONARY_FILE = "/usr/share/dict/words"
+# Where load_dictionary keeps the words it has already read and filtered
+DICTIONARY_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                "dictionary.cache")
+# Bump to throw away caches written in an older format
+_CACHE_VERSION = 1
 
 
 # Words that are in the dictionary that I am removing from consideration
@@ -41,14 +47,119 @@ KNOWN_GOOD = set([
 ])
 
 
+# Counts the changes made through edit_word_lists, so that anything caching
+# is_english verdicts (see util.VerdictMemo) can tell when to start over
+WORD_LISTS_VERSION = 0
+
+
+def edit_word_lists(blacklist=(), known_good=(), remove=False):
+    """
+    Add words to BLACKLIST and KNOWN_GOOD, or take them out with remove.
+    Change the lists through here rather than editing the sets directly,
+    otherwise cached verdicts go stale until util.invalidate_verdicts is
+    called.
+
+    Arguments:
+        blacklist: iterable of lowercase str words
+        known_good: iterable of lowercase str words
+        remove: bool, take the words out instead of adding them
+    """
+    global WORD_LISTS_VERSION
+    edit = set.difference_update if remove else set.update
+    edit(BLACKLIST, blacklist)
+    edit(KNOWN_GOOD, known_good)
+    WORD_LISTS_VERSION += 1
+
+
 def is_english(word):
     word = word.lower()
+    if len(word) in _derived("WORD_LENGTHS"):
+        english = english_dictionary()
+    else:
+        english = full_dictionary()
     return (
-        word in _english and word not in BLACKLIST or
+        word in english and word not in BLACKLIST or
         word in KNOWN_GOOD
     )
 
 
+def load_dictionary(lengths=None, path=DICTIONARY_FILE,
+                    cache=DICTIONARY_CACHE):
+    """
+    Read the lowercased words of a dictionary file, optionally only those of
+    certain lengths. The result is saved to a cache file the first time, and
+    after that read back in one go as long as the dictionary file hasn't
+    changed (same modification time and size).
+
+    BLACKLIST and KNOWN_GOOD aren't applied here, is_english applies them
+    as it goes so that changing them takes effect straight away.
+
+    Arguments:
+        lengths: None (all words) or an iterable of word lengths to keep
+        path: str, dictionary file with one word per line
+        cache: None (no caching) or str, cache file to read and write
+
+    Returns:
+        set of lowercase str words
+    """
+    status = os.stat(path)
+    header = "{} {} {} {} {}".format(
+        _CACHE_VERSION, os.path.abspath(path), status.st_mtime_ns,
+        status.st_size,
+        "all" if lengths is None else ",".join(map(str, sorted(lengths)))
+    ).encode()
+
+    if cache is not None:
+        try:
+            with open(cache, "rb") as cache_file:
+                cached_header, _, body = cache_file.read().partition(b"\n")
+            if cached_header == header:
+                return set(body.decode().split("\n")) if body else set()
+        except OSError:
+            pass
+
+    with open(path) as word_file:
+        words = set(word_file.read().lower().split())
+    if lengths is not None:
+        lengths = set(lengths)
+        words = set(word for word in words if len(word) in lengths)
+
+    if cache is not None:
+        # Write then rename, so a reader never sees half a cache
+        partial = "{}.{}".format(cache, os.getpid())
+        try:
+            with open(partial, "wb") as cache_file:
+                cache_file.write(header + b"\n" +
+                                 "\n".join(sorted(words)).encode())
+            os.replace(partial, cache)
+        except OSError:
+            pass
+    return words
+
+
+def english_dictionary():
+    """
+    The words in DICTIONARY_FILE with lengths in WORD_LENGTHS, which covers
+    every word we score. Loaded (through the cache) on first use, so imports
+    that never check a word don't pay for it.
+    """
+    global _english
+    if _english is None:
+        _english = load_dictionary(_derived("WORD_LENGTHS"))
+    return _english
+
+
+def full_dictionary():
+    """
+    Every word in DICTIONARY_FILE, for the rare lookups of words with lengths
+    that aren't in WORD_LENGTHS. Only read when first needed.
+    """
+    global _full_english
+    if _full_english is None:
+        _full_english = load_dictionary(cache=None)
+    return _full_english
+
+
 ASSUMED = {
     22: "9",
     23: "4",
@@ -267,33 +378,109 @@ CHARACTERS = (
     15, 4, 13, 14, 5, 44,
 )
 
-# Set of unknown characters
-UNKNOWN = set(CHARACTERS) - set(ASSUMED.keys())
-
-# Tuple of all words
-_words = []
-_word = []
-for _character in CHARACTERS:
-    if _character in ASSUMED:
-        if _word:
-            _words.append(tuple(_word))
-            _word = []
-    else:
-        _word.append(_character)
-WORDS = tuple(_words)
-# Counter object of all characters and words
-CHARACTER_FREQ = collections.Counter([character for character in CHARACTERS
-                                      if character not in ASSUMED])
-WORD_FREQ = collections.Counter(WORDS)
-
-# Set of unique words
-WORD_SET = set(WORDS)
-# Counter object of characters in the word set (to avoid influence by repeated
-# phrases)
-_word_set_characters = []
-for _word in WORD_SET:
-    _word_set_characters.extend(list(_word))
-SET_FREQ = collections.Counter(_word_set_characters)
+# Values derived from CHARACTERS are computed on first access (see
+# __getattr__), so importing this module stays cheap
+
+
+def _unknown():
+    """Set of unknown characters"""
+    return set(CHARACTERS) - set(ASSUMED.keys())
+
+
+def _words():
+    """Tuple of all words"""
+    words = []
+    word = []
+    for character in CHARACTERS:
+        if character in ASSUMED:
+            if word:
+                words.append(tuple(word))
+                word = []
+        else:
+            word.append(character)
+    return tuple(words)
+
+
+def _character_freq():
+    """Counter object of all characters"""
+    return collections.Counter([character for character in CHARACTERS
+                                if character not in ASSUMED])
+
+
+def _word_freq():
+    """Counter object of all words"""
+    return collections.Counter(_derived("WORDS"))
+
+
+def _word_set():
+    """Set of unique words"""
+    return set(_derived("WORDS"))
+
+
+def _set_freq():
+    """
+    Counter object of characters in the word set (to avoid influence by
+    repeated phrases)
+    """
+    characters = []
+    for word in _derived("WORD_SET"):
+        characters.extend(list(word))
+    return collections.Counter(characters)
+
+
+def _word_lengths():
+    """Lengths of the words in the word set"""
+    return frozenset(len(word) for word in _derived("WORD_SET"))
+
+
+# Get the two lists of frequency-sorts cipher characters (different assumptions
+# on their base data)
+def _character_freq_list():
+    return [
+        key for key, value in
+        sorted(_derived("CHARACTER_FREQ").items(), key=lambda x: x[1],
+               reverse=True)
+    ]
+
+
+def _set_freq_list():
+    return [
+        key for key, value in
+        sorted(_derived("SET_FREQ").items(), key=lambda x: x[1], reverse=True)
+    ]
+
+
+_DERIVED = {
+    "UNKNOWN": _unknown,
+    "WORDS": _words,
+    "CHARACTER_FREQ": _character_freq,
+    "WORD_FREQ": _word_freq,
+    "WORD_SET": _word_set,
+    "SET_FREQ": _set_freq,
+    "WORD_LENGTHS": _word_lengths,
+    "CHARACTER_FREQ_LIST": _character_freq_list,
+    "SET_FREQ_LIST": _set_freq_list,
+}
+
+
+def _derived(name):
+    """Get one of the _DERIVED values, computing it on first use."""
+    if name not in globals():
+        globals()[name] = _DERIVED[name]()
+    return globals()[name]
+
+
+def __getattr__(name):
+    if name in _DERIVED:
+        return _derived(name)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+# Dictionary words, see english_dictionary and full_dictionary
+_english = None
+_full_english = None
 
 
 # English letters sorted, from here:
@@ -301,16 +488,6 @@ SET_FREQ = collections.Counter(_word_set_characters)
 ENGLISH_FREQ_LIST = ("e", "t", "a", "o", "i", "n", "s", "r", "h", "d", "l",
                      "u", "c", "m", "f", "y", "w", "g", "p", "b", "v", "k",
                      "x", "q", "j", "z")
-# Get the two lists of frequency-sorts cipher characters (different assumptions
-# on their base data)
-CHARACTER_FREQ_LIST = [
-    key for key, value in
-    sorted(CHARACTER_FREQ.items(), key=lambda x: x[1], reverse=True)
-]
-SET_FREQ_LIST = [
-    key for key, value in
-    sorted(SET_FREQ.items(), key=lambda x: x[1], reverse=True)
-]
 
 
 # Example of how keys look (could be up to 26 pairs long)
@@ -0,0 +1,202 @@
+#!/usr/bin/python3
+
+import cmd
+import string
+
+import data
+import scoring
+import util
+
+
+class KeyShell(cmd.Cmd):
+    """
+    Command line for editing a key by hand. The dictionary, word table and
+    current key stay loaded, and every edit is rescored incrementally (see
+    scoring.IncrementalScorer), so the decoded text and score come back
+    straight away.
+    """
+
+    intro = ("Edit the key by hand, the decoded text is redisplayed after"
+             " every change. Type help or ? to list commands.")
+    prompt = "(key) "
+
+    def __init__(self, table, key=(), checked_keys=None, stdin=None,
+                 stdout=None):
+        """
+        Arguments:
+            table: scoring.WordTable of the words to score
+            key: tuple of tuple pairs, the key to start from
+            checked_keys: None, or a dict/store of {key: score} that the save
+                command adds to
+            stdin, stdout: see cmd.Cmd
+        """
+        super().__init__(stdin=stdin, stdout=stdout)
+        self.scorer = scoring.IncrementalScorer(table, key)
+        self.checked_keys = checked_keys
+        # Cipher characters that set and swap aren't allowed to change
+        self.frozen = set()
+        # Stack of ({character: letter or None}, frozen) before each edit
+        self.history = []
+
+    def write(self, text):
+        self.stdout.write(text + "\n")
+
+    def display(self):
+        """Write out the decoded text and score of the current key."""
+        self.write(util.display_key(self.scorer.key(),
+                                    include_characters=True,
+                                    score=self.scorer.score))
+        if self.frozen:
+            self.write("Frozen: {}".format(sorted(self.frozen)))
+
+    def onecmd(self, line):
+        # Bad input shouldn't end the session
+        try:
+            return super().onecmd(line)
+        except ValueError as error:
+            self.write("Error: {}".format(error))
+
+    def emptyline(self):
+        # The default repeats the last command, which could be an edit
+        pass
+
+    def _remember(self, characters):
+        """Save what's needed to undo an edit touching characters."""
+        self.history.append((
+            {character: self.scorer.mapping.get(character)
+             for character in characters},
+            set(self.frozen),
+        ))
+
+    def _unfrozen(self, character):
+        if character in self.frozen:
+            raise ValueError("{} is frozen, thaw it first".format(character))
+        return character
+
+    def do_set(self, arg):
+        """set CHARACTER LETTER: map a cipher character to a letter. If
+        another character had the letter it becomes unmapped"""
+        character, letter = _parse(arg, 2)
+        character = self._unfrozen(_character(character))
+        letter = _letter(letter)
+        owner = self.scorer.owners.get(letter, character)
+        if owner != character:
+            self._unfrozen(owner)
+        self._remember((character, owner))
+        if owner != character:
+            self.scorer.assign(owner, None)
+        self.scorer.assign(character, letter)
+        self.display()
+
+    def do_unset(self, arg):
+        """unset CHARACTER: remove a cipher character from the key"""
+        character, = _parse(arg, 1)
+        character = self._unfrozen(_character(character))
+        self._remember((character, ))
+        self.scorer.assign(character, None)
+        self.display()
+
+    def do_swap(self, arg):
+        """swap CHARACTER CHARACTER: swap the letters of two cipher
+        characters"""
+        first, second = (self._unfrozen(_character(character))
+                         for character in _parse(arg, 2))
+        self._remember((first, second))
+        self.scorer.swap(first, second)
+        self.display()
+
+    def do_freeze(self, arg):
+        """freeze [CHARACTER ...]: stop characters from being changed. With
+        no characters, freeze every pair that is part of an English word"""
+        if arg.split():
+            characters = [_character(character) for character in arg.split()]
+        else:
+            characters = [character for character, _ in
+                          util.get_word_pairs(self.scorer.key())]
+        self._remember(())
+        self.frozen.update(characters)
+        self.display()
+
+    def do_thaw(self, arg):
+        """thaw [CHARACTER ...]: undo freeze, for every character if none are
+        given"""
+        self._remember(())
+        if arg.split():
+            self.frozen.difference_update(
+                _character(character) for character in arg.split()
+            )
+        else:
+            self.frozen.clear()
+        self.display()
+
+    def do_undo(self, arg):
+        """undo: reverse the last edit"""
+        if not self.history:
+            self.write("Nothing to undo")
+            return
+        pairs, self.frozen = self.history.pop()
+        # Clear first so that letters are free to go back where they were
+        for character in pairs:
+            self.scorer.assign(character, None)
+        for character, letter in pairs.items():
+            if letter is not None:
+                self.scorer.assign(character, letter)
+        self.display()
+
+    def do_show(self, arg):
+        """show: display the decoded text and score again"""
+        self.display()
+
+    def do_words(self, arg):
+        """words: list the English words that make up the score"""
+        self.write(str(sorted(util.get_english_words(self.scorer.key()))))
+
+    def do_key(self, arg):
+        """key: print the current key, e.g. to pass to --polish-key"""
+        self.write(str(self.scorer.key()))
+
+    def do_save(self, arg):
+        """save: add the current key to the checked keys"""
+        if self.checked_keys is None:
+            self.write("No checked keys to save to")
+            return
+        util.check_key(self.checked_keys, data.WORD_SET, self.scorer.key())
+        self.write("Saved with score {:.4f}".format(self.scorer.score))
+
+    def do_quit(self, arg):
+        """quit: leave the shell"""
+        return True
+
+    def do_EOF(self, arg):
+        """Ctrl-D: leave the shell"""
+        self.write("")
+        return True
+
+
+def _parse(arg, number):
+    """Split a command's argument into exactly number words."""
+    words = arg.split()
+    if len(words) != number:
+        raise ValueError("Expected {} argument(s), got {!r}".format(number,
+                                                                   arg))
+    return words
+
+
+def _character(text):
+    """Parse an unknown cipher character (see data.UNKNOWN)."""
+    try:
+        character = int(text)
+    except ValueError:
+        raise ValueError("{!r} isn't a cipher character".format(text))
+    if character not in data.UNKNOWN:
+        raise ValueError("{} isn't an unknown cipher character".format(
+            character
+        ))
+    return character
+
+
+def _letter(text):
+    letter = text.lower()
+    if len(letter) != 1 or letter not in string.ascii_lowercase:
+        raise ValueError("{!r} isn't a letter".format(text))
+    return letter
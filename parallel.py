@@ -0,0 +1,258 @@
+#!/usr/bin/python3
+
+import collections
+import multiprocessing
+
+import numpy
+
+import codec
+import data
+import scoring
+import store
+import util
+
+
+# State held by each worker process, filled in by _initialize. Each worker
+# builds its own copy of the dictionary structures
+_worker = {}
+
+
+def _initialize(checked_keys, domains):
+    """Set up a worker process for random_search."""
+    # SQLite connections can't be shared across a fork, so open our own
+    if isinstance(checked_keys, store.SQLiteKeyStore):
+        checked_keys = store.SQLiteKeyStore(checked_keys.path)
+    _worker["scorer"] = scoring.BatchScorer(data.WORD_SET)
+    # Keys this worker has generated, on top of the keys already checked
+    # when the pool started
+    _worker["generated"] = {}
+    _worker["seen"] = collections.ChainMap(_worker["generated"], checked_keys)
+    _worker["domains"] = domains
+
+
+def _random_batch(task):
+    """
+    Generate and score a batch of random keys in a worker.
+
+    Arguments:
+        task: tuple of (number of keys, numpy.random.SeedSequence for the
+            batch's random stream)
+
+    Returns:
+        list of (packed key, float score) pairs, in the checked_keys format
+    """
+    number, seed = task
+    keys = util.generate_random_keys(numpy.random.default_rng(seed),
+                                     _worker["seen"],
+                                     number,
+                                     domains=_worker["domains"])
+    if not len(keys):
+        return []
+
+    scores = _worker["scorer"].score(keys)
+    packed = [row.tobytes() for row in keys]
+    _worker["generated"].update(dict.fromkeys(packed))
+    return list(zip(packed, scores.tolist()))
+
+
+def _spawn(seed, number):
+    """
+    Split a seed into number independent SeedSequences.
+
+    Arguments:
+        seed: None (fresh entropy), an int, or a numpy.random.SeedSequence
+        number: int, number of streams to spawn
+    """
+    if not isinstance(seed, numpy.random.SeedSequence):
+        seed = numpy.random.SeedSequence(seed)
+    return seed.spawn(number)
+
+
+def random_search(checked_keys, number, workers, batch_size=1000,
+                  domains=None, seed=None):
+    """
+    Generate and score random keys over a pool of worker processes, merging
+    the results into checked_keys.
+
+    Workers only know about the keys that were checked when the pool started
+    and the keys they made themselves, so two workers can come up with the
+    same key. Those duplicates are dropped here when merging.
+
+    Every batch gets its own random stream spawned from seed, so with a fixed
+    seed the same keys come out no matter how many workers there are (unless
+    two batches happen to collide).
+
+    Arguments:
+        checked_keys: dict, contains {packed key: float score}, or one of the
+            stores in store.py
+        number: int, number of keys to generate across all workers
+        workers: int, number of worker processes
+        batch_size: int, number of keys a worker generates per task
+        domains: see util.generate_random_key
+        seed: see _spawn
+
+    Returns:
+        int, number of new keys added to checked_keys
+
+    Note that the dictionary checked_keys is modified
+    """
+    sizes = [batch_size] * (number // batch_size)
+    if number % batch_size:
+        sizes.append(number % batch_size)
+
+    # Make sure workers see everything that's been stored so far
+    if hasattr(checked_keys, "flush"):
+        checked_keys.flush()
+
+    added = 0
+    with multiprocessing.Pool(workers,
+                              initializer=_initialize,
+                              initargs=(checked_keys, domains)) as pool:
+        tasks = zip(sizes, _spawn(seed, len(sizes)))
+        for results in pool.imap(_random_batch, tasks):
+            for key, score in results:
+                if key not in checked_keys:
+                    checked_keys[key] = score
+                    added += 1
+    return added
+
+
+def _initialize_polish(checked_keys, domains):
+    """Set up a worker process for polish_islands."""
+    # SQLite connections can't be shared across a fork, so open our own
+    if isinstance(checked_keys, store.SQLiteKeyStore):
+        checked_keys = store.SQLiteKeyStore(checked_keys.path)
+    _worker["checked"] = checked_keys
+    _worker["domains"] = domains
+
+
+def _polish_island(task):
+    """
+    Run util.polish_known_key on one island's key in a worker. Keys already
+    checked before the round started are skipped, wherever they came from.
+
+    Arguments:
+        task: tuple of (key, n_depth, n_breadth, numpy.random.SeedSequence
+            for the island's random stream)
+
+    Returns:
+        tuple of (dict of the keys checked, best key, best score), where the
+        best key is the starting key if nothing beat it
+    """
+    key, n_depth, n_breadth, seed = task
+    checked_keys = {}
+    RNG = util.sample_exponential(numpy.random.default_rng(seed))
+    util.polish_known_key(RNG=RNG,
+                          checked_keys=collections.ChainMap(
+                              checked_keys, _worker["checked"]
+                          ),
+                          words=data.WORD_SET,
+                          key=key,
+                          n_depth=n_depth,
+                          n_breadth=n_breadth,
+                          domains=_worker["domains"])
+
+    score = util.score_words(data.WORD_SET, key)
+    ranked_keys, scores = util.get_ranked_keys(checked_keys, number=1)
+    if scores[0] > score:
+        key, score = ranked_keys[0], scores[0]
+    return checked_keys, key, score
+
+
+def _migrate(islands, alternatives):
+    """
+    Ring migration, every island takes over its neighbour's best key if it
+    beats its own. No two islands are given the same key, since they would
+    only repeat each other's work. An island that would get a key another
+    island already has falls back on its own key, then on its alternatives.
+
+    Arguments:
+        islands: list of (key, score) tuples, the best key of each island
+        alternatives: list of lists of (key, score) tuples, the next best
+            keys each island found, best first
+
+    Returns:
+        list of (key, score) tuples, the key to start each island from
+    """
+    taken = set()
+    migrated = []
+    for i, island in enumerate(islands):
+        wanted = max(island, islands[i - 1], key=lambda x: x[1])
+        for choice in [wanted, island] + alternatives[i]:
+            if codec.pack(choice[0]) not in taken:
+                wanted = choice
+                break
+        taken.add(codec.pack(wanted[0]))
+        migrated.append(wanted)
+    return migrated
+
+
+def polish_islands(checked_keys, keys, workers, n_depth=100, n_breadth=100,
+                   migrations=0, domains=None, seed=None):
+    """
+    Polish many keys at once, one island (util.polish_known_key run) per key,
+    spread over a pool of worker processes.
+
+    With migrations, the depth is split into migrations + 1 rounds. Between
+    rounds the islands form a ring and each one takes over its neighbour's
+    best key if it beats its own (see _migrate). Since polish_known_key
+    freezes the pairs that make English words, the frozen pairs travel along
+    with the key. Every round's workers see all the keys checked so far, in
+    checked_keys and by the other islands, and don't check them again.
+
+    Arguments:
+        checked_keys: dict, contains {packed key: float score}, or one of the
+            stores in store.py
+        keys: list of keys to start the islands from
+        workers: int, number of worker processes
+        n_depth: int, total depth per island, see polish_known_key
+        n_breadth: int, see polish_known_key
+        migrations: int, number of times the islands exchange keys
+        domains: see util.generate_random_key
+        seed: see _spawn, each island gets its own stream every round
+
+    Returns:
+        list of (key, score) tuples, the best key found by each island
+
+    Note that the dictionary checked_keys is modified
+    """
+    rounds = migrations + 1
+    depths = [n_depth // rounds] * rounds
+    depths[-1] += n_depth % rounds
+    islands = [(key, 0.0) for key in keys]
+
+    seeds = _spawn(seed, rounds)
+    for round_number, depth in enumerate(depths):
+        # Make sure workers see everything that's been stored so far
+        if hasattr(checked_keys, "flush"):
+            checked_keys.flush()
+
+        streams = seeds[round_number].spawn(len(islands))
+        # A fresh pool each round, so the workers start from everything
+        # checked in the rounds before
+        with multiprocessing.Pool(workers,
+                                  initializer=_initialize_polish,
+                                  initargs=(checked_keys, domains)) as pool:
+            results = pool.map(_polish_island,
+                               [(key, depth, n_breadth, stream)
+                                for (key, _), stream in zip(islands,
+                                                            streams)])
+
+        islands = []
+        alternatives = []
+        for checked, key, score in results:
+            for packed, checked_score in checked.items():
+                checked_keys.setdefault(packed, checked_score)
+            islands.append((key, score))
+            ranked_keys, scores = util.get_ranked_keys(
+                checked, number=len(results) + 1
+            )
+            alternatives.append([(ranked_key, ranked_score) for
+                                 ranked_key, ranked_score in zip(ranked_keys,
+                                                                 scores)
+                                 if ranked_key is not None])
+
+        if len(islands) > 1 and round_number < migrations:
+            islands = _migrate(islands, alternatives)
+
+    return islands
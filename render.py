@@ -0,0 +1,267 @@
+#!/usr/bin/python3
+
+import collections
+import cv2
+import functools
+import glob
+import numpy
+import os
+
+import codec
+
+
+# The maximum size each individual character can be
+SHAPE = (90, 70, 3)
+# The height to allow for cv2.putText
+TEXT_BUFFER = 40
+# The height to allow for each row of character + text
+LINE_BUFFER = TEXT_BUFFER + 10
+# Size and weight of the text drawn under each character
+FONT_SCALE = 1.5
+THICKNESS = 2
+# Whitespace left past the last drawn pixel
+MARGIN = 20
+# Where the character images live, as image_{character}.png
+IMAGE_DIRECTORY = "images"
+# Tracks the current spot where we are inserting characters
+Cursor = collections.namedtuple('Cursor', ['x', 'ymin', 'ymax'])
+# Where a character image goes (top left corner) and where the text under it
+# starts, in cv2.putText's (x, y) order
+Placement = collections.namedtuple('Placement',
+                                   ['character', 'x', 'y', 'text_org'])
+
+# Atlases loaded so far, {directory: GlyphAtlas}
+_atlases = {}
+
+
+class GlyphAtlas:
+    """
+    Every character image, read once and packed side by side into a single
+    uint8 array, SHAPE[0] rows tall.
+    """
+
+    def __init__(self, directory=IMAGE_DIRECTORY):
+        """
+        Arguments:
+            directory: str, holding an image_{character}.png per character
+        """
+        images = {}
+        for path in glob.glob(os.path.join(directory, "image_*.png")):
+            name = os.path.splitext(os.path.basename(path))[0]
+            images[int(name[len("image_"):])] = cv2.imread(path)
+
+        # {character: (x offset in pixels, glyph height, glyph width)}
+        self.glyphs = {}
+        self.pixels = numpy.full(
+            (SHAPE[0], sum(image.shape[1] for image in images.values()), 3),
+            255, dtype=numpy.uint8
+        )
+        x = 0
+        for character, image in sorted(images.items()):
+            height, width = image.shape[:2]
+            self.pixels[:height, x:x + width] = image
+            self.glyphs[character] = (x, height, width)
+            x += width
+
+    def glyph(self, character):
+        """Return a view of the image for a character."""
+        x, height, width = self.glyphs[character]
+        return self.pixels[:height, x:x + width]
+
+
+def load_atlas(directory=IMAGE_DIRECTORY):
+    """Get the GlyphAtlas for a directory, only reading the images once."""
+    if directory not in _atlases:
+        _atlases[directory] = GlyphAtlas(directory)
+    return _atlases[directory]
+
+
+def layout(characters, assumed, atlas, rows=1):
+    """
+    Work out where every character image goes, following the lines of the
+    text.
+
+    Arguments:
+        characters: tuple of ciphertext characters (integers)
+        assumed: dictionary of {character: ascii}, see data.ASSUMED
+        atlas: GlyphAtlas
+        rows: int, number of text rows to leave room for under each line.
+            The text_org of each Placement is for the first row
+
+    Returns:
+        list of Placement, one per character that isn't a newline
+    """
+    placements = []
+    # Make a cursor tracking the next position to add a character
+    cursor = Cursor(x=0, ymin=0, ymax=SHAPE[0])
+    for character in characters:
+        # If we get a newline, update the cursor. If not, place a character
+        if character in assumed and assumed[character] == "\n":
+            # Zero the x position and bump the height down
+            cursor = Cursor(x=0,
+                            ymin=cursor.ymax + rows * LINE_BUFFER,
+                            ymax=cursor.ymax + rows * LINE_BUFFER + SHAPE[0])
+        else:
+            _, height, width = atlas.glyphs[character]
+            # Calculate where the image should be placed vertically so that it
+            # will be centered on the cursor. The character images have
+            # variable heights depending on the character shape
+            placements.append(Placement(
+                character=character,
+                x=cursor.x,
+                y=calculate_y_edge(cursor, (height, width)),
+                # WTF - why is putText location in (horizontal, vertical)?
+                text_org=(cursor.x + width // 4, cursor.ymax + TEXT_BUFFER),
+            ))
+            cursor = Cursor(x=cursor.x + width,
+                            ymin=cursor.ymin,
+                            ymax=cursor.ymax)
+    return placements
+
+
+def text_under(character, assumed, mapping=None):
+    """
+    Figure out what we want to map cipher text to, to display it underneath
+    the cipher representation.
+    """
+    if character in assumed:
+        return assumed[character]
+    if mapping and character in mapping:
+        return mapping[character]
+    return "?"
+
+
+def draw_text(image, text, org):
+    cv2.putText(
+        img=image,
+        text=text,
+        org=org,
+        fontFace=cv2.FONT_HERSHEY_SIMPLEX,
+        fontScale=FONT_SCALE,
+        color=(0, 0, 0),
+        thickness=THICKNESS,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def text_size(text):
+    """Return the (width, depth below the baseline) of draw_text's text."""
+    (width, _), baseline = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX,
+                                           FONT_SCALE, THICKNESS)
+    return width + THICKNESS, baseline + THICKNESS
+
+
+def crop(image, margin=MARGIN):
+    """Clip the image to margin past where we stop hitting blank whitespace."""
+    # Reduce along whole rows first, which is much faster than reducing over
+    # the 3 channels of every pixel
+    rows = numpy.flatnonzero(image.reshape(len(image), -1).min(axis=1) < 255)
+    columns = numpy.flatnonzero(image.min(axis=0).min(axis=1) < 255)
+    return image[0:rows[-1] + margin, 0:columns[-1] + margin]
+
+
+def render_characters(characters, assumed, mapping=None, atlas=None):
+    """
+    Render the cipher text with our mapping underneath, see
+    check_characters_with_image. The canvas is sized to fit the layout
+    exactly and everything stays uint8, so this is cheap enough to call often.
+
+    Returns:
+        uint8 image array, (y, x, 3)
+    """
+    return render_contact_sheet(characters, assumed, [mapping], atlas=atlas)
+
+
+def render_contact_sheet(characters, assumed, mappings, atlas=None):
+    """
+    Render the cipher text once with a row of text under every line for each
+    mapping, in order, so many keys can be compared at a glance. Only the
+    text rows depend on the mappings, the glyphs are drawn a single time.
+
+    Arguments:
+        characters: tuple of ciphertext characters (integers)
+        assumed: dictionary of {character: ascii}, see data.ASSUMED
+        mappings: list of mappings, see check_characters_with_image
+        atlas: None (use load_atlas) or a GlyphAtlas
+
+    Returns:
+        uint8 image array, (y, x, 3)
+    """
+    if atlas is None:
+        atlas = load_atlas()
+    placements = layout(characters, assumed, atlas, rows=len(mappings))
+    rows = [[text_under(placement.character, assumed, mapping)
+             for placement in placements]
+            for mapping in mappings]
+
+    # Size the canvas to hold every glyph and every piece of text, plus the
+    # margin that gets left when cropping
+    height, width = 0, 0
+    for placement in placements:
+        _, glyph_height, glyph_width = atlas.glyphs[placement.character]
+        height = max(height, placement.y + glyph_height)
+        width = max(width, placement.x + glyph_width)
+    for row, texts in enumerate(rows):
+        for placement, text in zip(placements, texts):
+            text_width, text_depth = text_size(text)
+            height = max(height, placement.text_org[1] + row * LINE_BUFFER +
+                         text_depth)
+            width = max(width, placement.text_org[0] + text_width)
+    image = numpy.full((height + MARGIN, width + MARGIN, 3), 255,
+                       dtype=numpy.uint8)
+
+    # Note that in image space it goes (y, x), a.k.a. (vertical, horizontal)
+    for placement in placements:
+        glyph = atlas.glyph(placement.character)
+        image[placement.y:placement.y + glyph.shape[0],
+              placement.x:placement.x + glyph.shape[1]] = glyph
+    for row, texts in enumerate(rows):
+        for placement, text in zip(placements, texts):
+            x, y = placement.text_org
+            draw_text(image, text, (x, y + row * LINE_BUFFER))
+
+    return crop(image)
+
+
+def check_characters_with_image(characters, assumed, mapping=None,
+                                path="check_text_image.png"):
+    """
+    Writes image of stored characters for visual checking. Each line of text is
+    represented as
+        1) A line of the cipher text
+        2) Underneath it, our mapping of cipher to ascii (? by default)
+
+    Arguments:
+        mapping: None (in which case all non-assumed characters become "?") or
+            a dictionary of {unknown character (int): ascii}, where the unknown
+            characters are all stored as integers in CHARACTERS. Items in the
+            mapping will be displayed as such under the sipher text.
+        path: str, where to write the image
+
+    Returns nothing
+    """
+    cv2.imwrite(path, render_characters(characters, assumed, mapping))
+
+
+def write_contact_sheet(characters, assumed, keys,
+                        path="contact_sheet.png"):
+    """
+    Writes a contact sheet (see render_contact_sheet) of keys for visual
+    triage, with a row of text per key under each line of cipher text.
+
+    Arguments:
+        keys: list of keys, in any form codec.pack accepts. None entries
+            (as padded on by util.get_ranked_keys) are skipped
+        path: str, where to write the image
+
+    Returns nothing
+    """
+    mappings = [dict(codec.unpack(codec.pack(key)))
+                for key in keys if key is not None]
+    cv2.imwrite(path, render_contact_sheet(characters, assumed, mappings))
+
+
+def calculate_y_edge(cursor, shape):
+    # Get the range and subtract the character size
+    empty = (cursor.ymax - cursor.ymin) - shape[0]
+    return cursor.ymin + int(empty / 2)
@@ -0,0 +1,457 @@
+#!/usr/bin/python3
+
+import collections
+from operator import itemgetter
+
+import numpy
+
+import codec
+import data
+
+
+# Keys in array form are packed keys (see codec.pack) stacked into rows
+KEY_WIDTH = codec.KEY_WIDTH
+UNMAPPED = codec.UNMAPPED
+LETTER_INDEX = codec.LETTER_INDEX
+# Mapped words are encoded as base-27 integers (0 is reserved for padding, so
+# "a" is 1 and "z" is 26). 27**12 fits comfortably in an int64
+BASE = 27
+
+
+def keys_to_array(keys):
+    """
+    Convert keys to an (N, KEY_WIDTH) uint8 array.
+
+    Arguments:
+        keys: iterable of keys, each a tuple of tuple pairs containing (cipher
+            character, ascii letter) or packed with codec.pack
+
+    Returns:
+        numpy array where array[i, character] is the letter index key i maps
+        the cipher character to, or UNMAPPED
+    """
+    packed = bytearray().join(map(codec.pack, keys))
+    return numpy.frombuffer(packed, dtype=numpy.uint8).reshape(-1, KEY_WIDTH)
+
+
+def array_to_keys(array):
+    """
+    Inverse of keys_to_array. Pairs come out in data.SET_FREQ_LIST order, same
+    as generate_random_key produces them.
+    """
+    return [codec.unpack(row.tobytes()) for row in numpy.atleast_2d(array)]
+
+
+def encode_word(word):
+    """Encode a string of lowercase letters as a base-27 integer."""
+    return sum((LETTER_INDEX[letter] + 1) * BASE ** i
+               for i, letter in enumerate(word))
+
+
+def english_vocabulary(lengths):
+    """
+    Return the set of lowercase a-z words that data.is_english accepts and that
+    have one of the given lengths.
+    """
+    lengths = set(lengths)
+    if lengths <= data.WORD_LENGTHS:
+        english = data.english_dictionary()
+    else:
+        english = data.full_dictionary()
+    return set(
+        word for word in english | data.KNOWN_GOOD
+        if len(word) in lengths and
+        all(letter in LETTER_INDEX for letter in word) and
+        data.is_english(word)
+    )
+
+
+class BatchScorer:
+    """
+    Scores many keys at once. The words are encoded once as padded arrays of
+    cipher characters, so mapping every word for every key is a single fancy
+    index into the key array. Mapped words are then encoded as integers and
+    checked against a sorted array of encoded English words.
+
+    Scores are identical to util.score_key(util.map_words(words, key), key).
+    """
+
+    def __init__(self, words=None, chunk_size=4096):
+        """
+        Arguments:
+            words: iterable of cipher words (tuples of ints), defaults to
+                data.WORD_SET
+            chunk_size: int, number of keys to map at once. The intermediate
+                arrays are (chunk_size, words, longest word) in size
+        """
+        if words is None:
+            words = data.WORD_SET
+        self.words = tuple(sorted(words))
+        self.chunk_size = chunk_size
+
+        length = max(len(word) for word in self.words)
+        self.characters = numpy.zeros((len(self.words), length),
+                                      dtype=numpy.intp)
+        self.mask = numpy.zeros((len(self.words), length), dtype=bool)
+        for i, word in enumerate(self.words):
+            self.characters[i, :len(word)] = word
+            self.mask[i, :len(word)] = True
+        # Place values for the base-27 encoding, zeroed in the padding
+        self.weights = numpy.where(
+            self.mask, BASE ** numpy.arange(length, dtype=numpy.int64), 0
+        )
+
+        self.vocabulary = numpy.array(
+            sorted(encode_word(word) for word in english_vocabulary(
+                len(word) for word in self.words
+            )),
+            dtype=numpy.int64,
+        )
+
+    def score(self, keys):
+        """
+        Arguments:
+            keys: (N, KEY_WIDTH) array, see keys_to_array
+
+        Returns:
+            (N,) float array of scores, the fraction of words that are English
+        """
+        keys = numpy.atleast_2d(keys)
+        scores = numpy.empty(len(keys))
+        for start in range(0, len(keys), self.chunk_size):
+            chunk = keys[start:start + self.chunk_size]
+            # (chunk, words, longest word) array of letter indices
+            letters = chunk[:, self.characters].astype(numpy.int64)
+            mapped = ((letters != UNMAPPED) | ~self.mask).all(axis=2)
+            codes = ((letters + 1) * self.weights).sum(axis=2)
+            # Binary search the sorted vocabulary for each code
+            found = numpy.searchsorted(self.vocabulary, codes)
+            found[found == len(self.vocabulary)] = 0
+            english = mapped & (self.vocabulary[found] == codes)
+            scores[start:start + len(chunk)] = \
+                english.sum(axis=1) / len(self.words)
+        return scores
+
+
+def word_pattern(word):
+    """
+    Get the letter-repetition pattern of a word, numbering letters in the order
+    they first appear. For example "illithid" -> (0, 1, 1, 0, 2, 3, 0, 4).
+    Works the same on strings and on cipher words (tuples of ints).
+    """
+    seen = {}
+    return tuple(seen.setdefault(letter, len(seen)) for letter in word)
+
+
+class PatternIndex:
+    """
+    English words grouped by letter-repetition pattern. Since keys map each
+    cipher character to a distinct letter, a mapped word always has the same
+    pattern as its cipher word, so only words in that group can match.
+    """
+
+    def __init__(self, vocabulary=None):
+        """
+        Arguments:
+            vocabulary: iterable of English words, defaults to the
+                english_vocabulary for the word lengths in data.WORD_SET
+        """
+        if vocabulary is None:
+            vocabulary = english_vocabulary(len(word)
+                                            for word in data.WORD_SET)
+        self.groups = collections.defaultdict(set)
+        for word in vocabulary:
+            self.groups[word_pattern(word)].add(word)
+
+    def candidates(self, word):
+        """Return the frozenset of English words compatible with word."""
+        return frozenset(self.groups.get(word_pattern(word), ()))
+
+
+def character_index(words, indices=None):
+    """
+    Build an inverted index from cipher character to the words containing it.
+
+    Arguments:
+        words: sequence of cipher words (tuples of ints)
+        indices: iterable of the indices into words to include, defaults to
+            all of them
+
+    Returns:
+        dict of {cipher character: tuple of word indices}
+    """
+    if indices is None:
+        indices = range(len(words))
+    index = collections.defaultdict(list)
+    for i in indices:
+        for character in set(words[i]):
+            index[character].append(i)
+    return {character: tuple(found) for character, found in index.items()}
+
+
+def sort_key(pairs):
+    """
+    Turn (cipher character, letter) pairs into a key, ordered the same way
+    generate_random_key orders them (data.SET_FREQ_LIST).
+    """
+    return tuple(sorted(
+        pairs, key=lambda pair: (codec.RANK.get(pair[0], len(codec.RANK)),
+                                 pair[0])
+    ))
+
+
+def consistent(word, candidate, mapping, owners):
+    """
+    Check whether a cipher word could map to a candidate English word, given
+    the partial key in mapping (and its reverse lookup, owners).
+    """
+    for character, letter in zip(word, candidate):
+        mapped = mapping.get(character)
+        if mapped is None:
+            if letter in owners:
+                return False
+        elif mapped != letter:
+            return False
+    return True
+
+
+def character_domains(table, key=(), tolerance=1):
+    """
+    Work out which letters each cipher character could plausibly be, by arc
+    consistency over the words. A letter stays in a character's domain only
+    if, in the words containing that character, there are pattern-compatible
+    candidates putting that letter in the character's position. Candidates
+    using letters outside the current domains are then dropped and the whole
+    thing is repeated until nothing changes.
+
+    Some words in the solution won't be in the dictionary, so a letter is only
+    ruled out when more than tolerance of the words containing the character
+    rule it out. Words that run out of candidates stop constraining anything,
+    and a domain is never narrowed down to nothing.
+
+    Arguments:
+        table: WordTable of the words to consider
+        key: tuple of tuple pairs, characters it maps have only that letter
+        tolerance: int, number of words that may disagree with a letter
+            before it is removed from a domain
+
+    Returns:
+        dict of {cipher character: frozenset of letters}
+    """
+    domains = {character: set(LETTER_INDEX) for character in table.containing}
+    for character, letter in key:
+        domains[character] = set(letter)
+    candidates = {i: table.candidates[i] for i in table.live}
+
+    changed = True
+    while changed:
+        candidates = {
+            i: [candidate for candidate in found if all(
+                letter in domains[character]
+                for character, letter in zip(table.words[i], candidate)
+            )]
+            for i, found in candidates.items()
+        }
+
+        # Count, for each character, how many words support each letter
+        support = collections.defaultdict(collections.Counter)
+        constraining = collections.Counter()
+        for i, found in candidates.items():
+            if not found:
+                continue
+            word = table.words[i]
+            for character in set(word):
+                position = word.index(character)
+                constraining[character] += 1
+                support[character].update(
+                    set(candidate[position] for candidate in found)
+                )
+
+        changed = False
+        for character, domain in domains.items():
+            narrowed = set(
+                letter for letter in domain
+                if support[character][letter] >=
+                constraining[character] - tolerance
+            )
+            if narrowed and narrowed != domain:
+                domains[character] = narrowed
+                changed = True
+
+    return {character: frozenset(domain)
+            for character, domain in domains.items()}
+
+
+class WordTable:
+    """
+    Precomputed table of pattern-compatible English candidates for each of a
+    fixed set of cipher words. Scoring a key is then a lookup of each mapped
+    word in that word's (small) candidate set.
+
+    For keys that map each cipher character to a distinct letter (all keys
+    that generate_random_key makes) scores are identical to util.score_key.
+    """
+
+    def __init__(self, words=None, index=None):
+        """
+        Arguments:
+            words: iterable of cipher words (tuples of ints), defaults to
+                data.WORD_SET
+            index: PatternIndex, built for these words if not given
+        """
+        if words is None:
+            words = data.WORD_SET
+        self.words = tuple(sorted(words))
+        if index is None:
+            index = PatternIndex(english_vocabulary(
+                len(word) for word in self.words
+            ))
+        self.candidates = tuple(index.candidates(word) for word in self.words)
+        # Fetches the mapped letters of a word out of a key dictionary,
+        # raising KeyError if any character is unmapped
+        self.getters = tuple(itemgetter(*word) for word in self.words)
+        # Words without any candidates can never score, so skip them entirely
+        self.live = tuple(i for i, candidates in enumerate(self.candidates)
+                          if candidates)
+        # Inverted index of the live words, {cipher character: word indices}
+        self.containing = character_index(self.words, self.live)
+
+    def verdict(self, index, mapping):
+        """
+        Arguments:
+            index: int, index of the word in self.words
+            mapping: dict of {cipher character: letter}
+
+        Returns:
+            bool, whether the word is fully mapped to English
+        """
+        try:
+            return "".join(self.getters[index](mapping)) in \
+                self.candidates[index]
+        except KeyError:
+            return False
+
+    def upper_bound(self, key):
+        """
+        Get the best score any completion of a partial key could reach. Fully
+        mapped words count only if they are English, while words that still
+        have unmapped characters count if any candidate agrees with the
+        mapped characters and only uses letters the key hasn't taken.
+
+        Arguments:
+            key: tuple of tuple pairs, see util.map_words. Can be partial
+
+        Returns:
+            float, an upper bound on the score of any key extending this one
+        """
+        mapping = dict(key)
+        owners = {letter: character for character, letter in key}
+        count = 0
+        for index in self.live:
+            word = self.words[index]
+            if any(consistent(word, candidate, mapping, owners)
+                   for candidate in self.candidates[index]):
+                count += 1
+        return count / len(self.words)
+
+    def score(self, key):
+        """
+        Arguments:
+            key: tuple of tuple pairs, see util.map_words
+
+        Returns:
+            float, fraction of the words that are English
+        """
+        mapping = dict(key)
+        count = 0
+        for index in self.live:
+            if self.verdict(index, mapping):
+                count += 1
+        return count / len(self.words)
+
+
+class IncrementalScorer:
+    """
+    Holds a current key along with the verdict for every word, and rescores
+    only the words touching the cipher characters that change. A swap of two
+    characters costs time proportional to the words containing them instead
+    of the whole ciphertext.
+    """
+
+    def __init__(self, table, key=()):
+        """
+        Arguments:
+            table: WordTable of the words to score
+            key: tuple of tuple pairs, the starting key. Must map each cipher
+                character to a distinct letter
+        """
+        self.table = table
+        self.mapping = dict(key)
+        # Reverse lookup so we can keep the key one-to-one
+        self.owners = {letter: character
+                       for character, letter in self.mapping.items()}
+        if len(self.owners) != len(self.mapping):
+            raise ValueError("Key {} maps two characters to one"
+                             " letter".format(key))
+        self.verdicts = [table.verdict(i, self.mapping)
+                         for i in range(len(table.words))]
+        self.count = sum(self.verdicts)
+
+    @property
+    def score(self):
+        """float, fraction of the words that are English (see score_key)"""
+        return self.count / len(self.table.words)
+
+    def key(self):
+        """Return the current key in the normal tuple form."""
+        return sort_key(self.mapping.items())
+
+    def _update(self, characters):
+        """Re-check the verdicts of words containing any of characters."""
+        affected = set()
+        for character in characters:
+            affected.update(self.table.containing.get(character, ()))
+        for i in affected:
+            verdict = self.table.verdict(i, self.mapping)
+            self.count += verdict - self.verdicts[i]
+            self.verdicts[i] = verdict
+        return self.score
+
+    def swap(self, first, second):
+        """
+        Swap the letters two cipher characters map to (either can be
+        unmapped, in which case the other becomes unmapped).
+
+        Returns:
+            float, the new score
+        """
+        first_letter = self.mapping.pop(first, None)
+        second_letter = self.mapping.pop(second, None)
+        if second_letter is not None:
+            self.mapping[first] = second_letter
+            self.owners[second_letter] = first
+        if first_letter is not None:
+            self.mapping[second] = first_letter
+            self.owners[first_letter] = second
+        return self._update((first, second))
+
+    def assign(self, character, letter):
+        """
+        Map a cipher character to a letter that no other character uses, or
+        unmap it if letter is None.
+
+        Returns:
+            float, the new score
+        """
+        if letter is not None and self.owners.get(letter, character) != \
+                character:
+            raise ValueError("Letter {} is already mapped from {}".format(
+                letter, self.owners[letter]
+            ))
+        old_letter = self.mapping.pop(character, None)
+        if old_letter is not None:
+            del self.owners[old_letter]
+        if letter is not None:
+            self.mapping[character] = letter
+            self.owners[letter] = character
+        return self._update((character, ))
@@ -0,0 +1,433 @@
+#!/usr/bin/python3
+
+import collections
+import heapq
+import math
+import string
+
+import data
+import scoring
+
+
+SearchResult = collections.namedtuple(
+    'SearchResult', ['key', 'score', 'evaluations']
+)
+AttackResult = collections.namedtuple(
+    'AttackResult', ['keys', 'scores', 'states']
+)
+# Default most complete assignments exhaustive_polish will enumerate, on
+# the order of a minute
+MAX_ASSIGNMENTS = int(1e6)
+# SearchResult plus the total number of states visited, and whether the
+# search stopped at max_states before it was exhaustive
+BoundResult = collections.namedtuple(
+    'BoundResult', ['key', 'score', 'evaluations', 'states', 'truncated']
+)
+
+
+def anneal(rng, table, key=(), n_steps=int(1e5), t_start=0.02, t_end=0.002,
+           target=None, characters=None, domains=None):
+    """
+    Walk the key space with simulated annealing. Each step either swaps the
+    letters of two cipher characters or reassigns a character to an unused
+    letter, and the move is rescored incrementally. Improvements are always
+    kept, while a move that loses score is kept with probability
+    exp(delta / temperature). The temperature drops geometrically from
+    t_start to t_end, so the walk settles into hill-climbing by the end.
+
+    Arguments:
+        rng: numpy.random.Generator
+        table: scoring.WordTable of the words to score
+        key: tuple of tuple pairs, the starting key (can be partial)
+        n_steps: int, maximum number of moves to try
+        t_start: float, starting temperature. Scores move in steps of
+            1 / len(words), so this is relative to that
+        t_end: float, final temperature
+        target: float, stop early once a key scores at least this well
+        characters: iterable of cipher characters that are allowed to change,
+            defaults to every character in the table's words
+        domains: None, or a dictionary of {cipher character: set of letters}
+            (see scoring.character_domains) that reassign moves pick from
+
+    Returns:
+        SearchResult of the best key seen, its score, and the number of score
+        evaluations it took to find
+    """
+    scorer = scoring.IncrementalScorer(table, key)
+    if characters is None:
+        characters = set(character for word in table.words
+                         for character in word)
+    characters = sorted(characters)
+    letters = string.ascii_lowercase
+
+    best = SearchResult(scorer.key(), scorer.score, 0)
+    current = scorer.score
+    cooling = (t_end / t_start) ** (1.0 / max(n_steps, 1))
+    temperature = t_start
+
+    for step in range(1, n_steps + 1):
+        if target is not None and best.score >= target:
+            break
+
+        if rng.random() < 0.5:
+            # Swap move
+            first, second = rng.choice(characters, size=2, replace=False)
+            first, second = int(first), int(second)
+            score = scorer.swap(first, second)
+            undo = (scorer.swap, first, second)
+        else:
+            # Reassign move, to a letter no other character is using
+            character = int(rng.choice(characters))
+            unused = [letter for letter in letters
+                      if letter not in scorer.owners]
+            if domains is not None and character in domains:
+                unused = [letter for letter in unused
+                          if letter in domains[character]] or unused
+            old_letter = scorer.mapping.get(character)
+            score = scorer.assign(character,
+                                  unused[rng.integers(len(unused))])
+            undo = (scorer.assign, character, old_letter)
+
+        delta = score - current
+        if delta >= 0 or rng.random() < math.exp(delta / temperature):
+            current = score
+            if score > best.score:
+                best = SearchResult(scorer.key(), score, step)
+        else:
+            undo[0](*undo[1:])
+
+        temperature *= cooling
+
+    return best
+
+
+def complete_key(mapping, owners):
+    """
+    Fill in any unmapped cipher characters with the unused letters, most
+    frequent first, and return the key in the normal tuple form.
+    """
+    mapping = dict(mapping)
+    unused = [letter for letter in data.ENGLISH_FREQ_LIST
+              if letter not in owners]
+    for character in data.SET_FREQ_LIST:
+        if character not in mapping and unused:
+            mapping[character] = unused.pop(0)
+    return scoring.sort_key(mapping.items())
+
+
+def dictionary_attack(table, number=10, max_misses=5, max_states=int(1e6),
+                      frozen=()):
+    """
+    Backtracking search that assigns whole English words to cipher words.
+    At each step the most constrained cipher word (fewest remaining
+    candidates, longest first on ties) is picked and each of its candidates
+    is tried in turn. The letters it implies are propagated to every other
+    word sharing those cipher characters, whose candidate lists are filtered
+    down. A word left with no candidates can't be English, so it counts as a
+    miss, and any branch with more than max_misses misses is pruned. Each
+    word can also be deliberately skipped (counted as a miss), so proper
+    nouns and words missing from the dictionary don't block the search.
+
+    Candidates come from the table, so data.BLACKLIST and data.KNOWN_GOOD are
+    respected. Words with no pattern-compatible candidate at all can never
+    score and don't count against max_misses.
+
+    Arguments:
+        table: scoring.WordTable of the words to solve
+        number: int, number of ranked keys to return
+        max_misses: int, number of words with candidates that may be left
+            unmatched
+        max_states: int, stop searching after visiting this many states
+        frozen: tuple of tuple pairs (like a key) to force into every key
+
+    Returns:
+        AttackResult of the ranked keys (best first), their scores, and the
+        number of states visited
+    """
+    words = table.words
+    mapping = dict(frozen)
+    owners = {letter: character for character, letter in mapping.items()}
+    # Min-heap of (score, key) holding the best number of complete keys
+    ranked = []
+    seen = set()
+    states = 0
+
+    def record():
+        key = complete_key(mapping, owners)
+        if key in seen:
+            return
+        seen.add(key)
+        entry = (table.score(key), key)
+        if len(ranked) < number:
+            heapq.heappush(ranked, entry)
+        elif entry[0] > ranked[0][0]:
+            heapq.heapreplace(ranked, entry)
+
+    def solve(candidates, misses):
+        nonlocal states
+        if states >= max_states:
+            return
+        states += 1
+
+        if not candidates:
+            record()
+            return
+
+        # Candidate lists of words untouched by recent assignments can be
+        # stale (they may use a letter that has since been taken), so they
+        # are re-checked here
+        index = min(candidates,
+                    key=lambda i: (len(candidates[i]), -len(words[i])))
+        rest = {i: found for i, found in candidates.items() if i != index}
+        word = words[index]
+
+        for candidate in candidates[index]:
+            if not scoring.consistent(word, candidate, mapping, owners):
+                continue
+
+            # Assign the implied letters
+            assigned = []
+            for character, letter in zip(word, candidate):
+                if character not in mapping:
+                    mapping[character] = letter
+                    owners[letter] = character
+                    assigned.append(character)
+
+            # Propagate them to the words sharing those characters
+            affected = set()
+            for character in assigned:
+                affected.update(table.containing.get(character, ()))
+            filtered = dict(rest)
+            forced = 0
+            for i in affected.intersection(rest):
+                found = tuple(
+                    other for other in rest[i]
+                    if scoring.consistent(words[i], other, mapping, owners)
+                )
+                if found:
+                    filtered[i] = found
+                else:
+                    del filtered[i]
+                    forced += 1
+
+            if misses + forced <= max_misses:
+                solve(filtered, misses + forced)
+
+            for character in assigned:
+                del owners[mapping.pop(character)]
+
+        # Try leaving this word unmatched
+        if misses < max_misses:
+            solve(rest, misses + 1)
+
+    candidates = {}
+    misses = 0
+    for i in table.live:
+        found = tuple(sorted(
+            candidate for candidate in table.candidates[i]
+            if scoring.consistent(words[i], candidate, mapping, owners)
+        ))
+        if found:
+            candidates[i] = found
+        else:
+            misses += 1
+    if misses <= max_misses:
+        solve(candidates, misses)
+
+    ranked = sorted(ranked, reverse=True)
+    return AttackResult([key for _, key in ranked],
+                        [score for score, _ in ranked],
+                        states)
+
+
+def branch_and_bound(table, key=(), best_score=0.0, max_states=None,
+                     domains=None):
+    """
+    Depth-first branch-and-bound over the cipher characters the key leaves
+    unmapped. Characters are assigned in data.SET_FREQ_LIST order, trying
+    letters in data.ENGLISH_FREQ_LIST order, and any partial key whose upper
+    bound (see scoring.WordTable.upper_bound) can't beat the best score so far
+    is pruned along with everything under it.
+
+    The bound is tracked incrementally by keeping each word's list of still
+    compatible candidates, refiltering only the words that contain the newly
+    assigned character. Lists of other words can go stale as letters get
+    used, which only loosens the bound, so it stays admissible.
+
+    Arguments:
+        table: scoring.WordTable of the words to score
+        key: tuple of tuple pairs, the partial key to extend
+        best_score: float, only keys scoring better than this are of interest
+            (e.g. the top score from get_ranked_keys)
+        max_states: int, stop after visiting this many states (None searches
+            exhaustively)
+        domains: None, or a dictionary of {cipher character: set of letters}
+            (see scoring.character_domains). Only letters in a character's
+            domain are tried, so the search is only exhaustive over those
+
+    Returns:
+        BoundResult of the best key found, its score, the number of states
+        visited when it was found, the total number of states visited and
+        whether max_states cut the search short. The key is None if nothing
+        beat best_score
+    """
+    words = table.words
+    mapping = dict(key)
+    owners = {letter: character for character, letter in mapping.items()}
+    # Only characters in words that could score matter
+    characters = [character for character, _ in scoring.sort_key(
+                      (character, None) for character in table.containing
+                  ) if character not in mapping]
+    best = SearchResult(None, best_score, 0)
+    states = 0
+    truncated = False
+
+    def solve(depth, candidates):
+        nonlocal best, states, truncated
+        if max_states is not None and states >= max_states:
+            truncated = True
+            return
+        states += 1
+
+        if depth == len(characters):
+            score = table.score(mapping.items())
+            if score > best.score:
+                best = SearchResult(scoring.sort_key(mapping.items()), score,
+                                    states)
+            return
+
+        character = characters[depth]
+        for letter in data.ENGLISH_FREQ_LIST:
+            if letter in owners:
+                continue
+            if (domains is not None and character in domains and
+                    letter not in domains[character]):
+                continue
+            mapping[character] = letter
+            owners[letter] = character
+
+            filtered = dict(candidates)
+            for i in table.containing[character]:
+                if i not in filtered:
+                    continue
+                found = tuple(
+                    candidate for candidate in filtered[i]
+                    if scoring.consistent(words[i], candidate, mapping, owners)
+                )
+                if found:
+                    filtered[i] = found
+                else:
+                    del filtered[i]
+
+            # Words that still have candidates are the most we could explain
+            if len(filtered) / len(words) > best.score:
+                solve(depth + 1, filtered)
+
+            del owners[mapping.pop(character)]
+
+    candidates = {}
+    for i in table.live:
+        found = tuple(
+            candidate for candidate in table.candidates[i]
+            if scoring.consistent(words[i], candidate, mapping, owners)
+        )
+        if found:
+            candidates[i] = found
+    if len(candidates) / len(words) > best.score:
+        solve(0, candidates)
+
+    return BoundResult(*best, states=states, truncated=truncated)
+
+
+def exhaustive_polish(table, key, frozen, domains=None,
+                      max_assignments=MAX_ASSIGNMENTS):
+    """
+    Try every assignment of the unused letters to the cipher characters that
+    aren't frozen, and keep the best. Assignments are enumerated depth first,
+    one character at a time, so each step is a single incremental rescore.
+
+    Only k-permutations of the letters are visited, n!/(n-k)! for n unused
+    letters and k unfrozen characters, and domains cut that down further.
+
+    Unlike Heap's algorithm, consecutive assignments don't always differ by
+    a single swap, since backing out of the search unassigns characters and
+    going back in assigns them again. Those steps are shared between all the
+    assignments below them, so it works out to under two single-character
+    rescores per assignment (1.87 with two spare letters), about what one
+    two-character swap of Heap's costs. In exchange the search can leave out
+    letters outside a character's domain instead of visiting every
+    permutation.
+
+    Arguments:
+        table: scoring.WordTable of the words to score
+        key: tuple of tuple pairs, the key to polish
+        frozen: tuple of tuple pairs that stay fixed (e.g. get_word_pairs of
+            the key). Pairs of key for characters outside the table's words
+            are also left alone
+        domains: None, or a dictionary of {cipher character: set of letters}
+            (see scoring.character_domains). Only letters in a character's
+            domain are tried
+        max_assignments: int, refuse to run if there could be more complete
+            assignments than this
+
+    Returns:
+        SearchResult of the best key, its score, and the number of complete
+        assignments scored
+    """
+    fixed = dict(frozen)
+    for character, letter in key:
+        if character not in table.containing and \
+                letter not in fixed.values():
+            fixed.setdefault(character, letter)
+    characters = [character for character, _ in scoring.sort_key(
+                      (character, None) for character in table.containing
+                  ) if character not in fixed]
+    letters = [letter for letter in data.ENGLISH_FREQ_LIST
+               if letter not in fixed.values()]
+    if len(letters) < len(characters):
+        raise ValueError("Not enough unused letters for {}".format(
+            characters
+        ))
+
+    # The letters each character can take, in frequency order
+    options = []
+    for character in characters:
+        if domains is not None and character in domains:
+            options.append([letter for letter in letters
+                            if letter in domains[character]])
+        else:
+            options.append(letters)
+    # Bound the number of assignments, without counting them exactly
+    assignments = min(math.prod(len(option) for option in options),
+                      math.perm(len(letters), len(characters)))
+    if assignments > max_assignments:
+        raise ValueError("Up to {} assignments of {} characters is more than"
+                         " {}".format(assignments, len(characters),
+                                      max_assignments))
+
+    scorer = scoring.IncrementalScorer(table, tuple(fixed.items()))
+    best = None
+    evaluations = 0
+
+    def solve(depth):
+        nonlocal best, evaluations
+        if depth == len(characters):
+            evaluations += 1
+            if best is None or scorer.score > best.score:
+                best = SearchResult(scorer.key(), scorer.score, evaluations)
+            return
+
+        character = characters[depth]
+        for letter in options[depth]:
+            if letter in scorer.owners:
+                continue
+            scorer.assign(character, letter)
+            solve(depth + 1)
+        scorer.assign(character, None)
+
+    solve(0)
+    if best is None:
+        raise ValueError("No assignment of {} fits the domains".format(
+            characters
+        ))
+    return best._replace(evaluations=evaluations)
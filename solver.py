@@ -2,15 +2,57 @@
 
 import argparse
 from ast import literal_eval
-import json
+
+import numpy
 
 import data
+import interactive
+import parallel
+import scoring
+import search
+import store
 import util
 
 
 # TODO: Load and write this to a non-git place, and initialize it with an empty
 # dict if it doesn't exist
 CHECKED_FILE = "checked_keys_dictionary.json"
+# Where --store binary keeps its append-only records
+BINARY_FILE = "checked_keys.bin"
+# Where --store sqlite keeps its database
+SQLITE_FILE = "checked_keys.sqlite"
+# Where --store bloom keeps its top keys and Bloom filter
+BLOOM_FILE = "checked_keys_bloom.npz"
+# Number of random keys to generate before scoring them together
+BATCH_SIZE = 10000
+
+
+def polish(RNG, checked_keys, key, table=None,
+           max_assignments=search.MAX_ASSIGNMENTS, domains=None):
+    """
+    Polish a key. If a table is given and there are few enough completions
+    once the English word pairs are frozen, every completion is tried with
+    search.exhaustive_polish. Otherwise fall back on util.polish_known_key.
+    """
+    if table is not None:
+        frozen = util.get_word_pairs(key)
+        try:
+            result = search.exhaustive_polish(
+                table, key, frozen, domains=domains,
+                max_assignments=max_assignments
+            )
+        except ValueError as error:
+            print("Polishing randomly instead: {}".format(error))
+        else:
+            util.check_key(checked_keys, data.WORD_SET, result.key)
+            print(util.display_key(result.key, score=result.score))
+            return
+
+    util.polish_known_key(RNG=RNG,
+                          checked_keys=checked_keys,
+                          words=data.WORD_SET,
+                          key=key,
+                          domains=domains)
 
 
 def main():
@@ -18,12 +60,67 @@ def main():
         description="Make new keys and examine the solve state",
         formatter_class=argparse.ArgumentDefaultsHelpFormatter
     )
+    parser.add_argument("-a", "--anneal",
+                        help="Search with simulated annealing, starting from"
+                             " --polish-key if given",
+                        action="store_true")
+    parser.add_argument("--anneal-steps",
+                        help="Number of annealing moves to try",
+                        type=int,
+                        default=int(1e5))
+    parser.add_argument("--anneal-temperature",
+                        help="Starting annealing temperature. Use a low value"
+                             " (e.g. 0.005) to stay near a good --polish-key",
+                        type=float,
+                        default=0.02)
     parser.add_argument("-b", "--polish-best",
-                        help="Polish the best 10 results",
+                        help="Polish the best --number-to-polish results",
+                        action="store_true")
+    parser.add_argument("--number-to-polish",
+                        help="Number of top results --polish-best polishes",
+                        type=int,
+                        default=10)
+    parser.add_argument("--migrations",
+                        help="With --polish-best and --workers, number of"
+                             " times the polish runs swap their best keys",
+                        type=int,
+                        default=0)
+    parser.add_argument("--branch-and-bound",
+                        help="Exhaustively search the letters not in English"
+                             " words of --polish-key (or of the best key),"
+                             " pruning anything that can't beat the best"
+                             " score",
+                        action="store_true")
+    parser.add_argument("--max-states",
+                        help="Most states --branch-and-bound visits before"
+                             " giving up on being exhaustive",
+                        type=int,
+                        default=int(1e5))
+    parser.add_argument("-d", "--dictionary-attack",
+                        help="Solve by assigning dictionary words to cipher"
+                             " words, with backtracking",
+                        action="store_true")
+    parser.add_argument("--max-misses",
+                        help="Number of words the dictionary attack may leave"
+                             " unmatched",
+                        type=int,
+                        default=5)
+    parser.add_argument("-D", "--domains",
+                        help="Only sample each cipher character from the"
+                             " letters that fit its words (arc consistency)",
                         action="store_true")
     parser.add_argument("-e", "--examine-results",
                         help="Examine the top N results",
                         action="store_true")
+    parser.add_argument("-x", "--exhaustive",
+                        help="When polishing, try every completion of the"
+                             " pairs not in English words if there are few"
+                             " enough of them",
+                        action="store_true")
+    parser.add_argument("--max-assignments",
+                        help="Most completions --exhaustive will enumerate",
+                        type=int,
+                        default=search.MAX_ASSIGNMENTS)
     parser.add_argument("-i", "--ipdb",
                         help="Open ipdb at end of script",
                         action="store_true")
@@ -38,8 +135,57 @@ def main():
     parser.add_argument("-o", "--output-best-guess",
                         help="Write out image of best guess",
                         action="store_true")
+    parser.add_argument("-c", "--contact-sheet",
+                        help="Write out one image of the top"
+                             " --number-to-examine results, with a row of"
+                             " text per key under the cipher text",
+                        action="store_true")
+    parser.add_argument("--interactive",
+                        help="Edit --polish-key (or the best key) by hand,"
+                             " with the text and score shown after every"
+                             " change",
+                        action="store_true")
     parser.add_argument("-p", "--polish-key",
                         help="Pass in a key and we'll try to improve it")
+    parser.add_argument("-W", "--workers",
+                        help="Number of processes to spread the random"
+                             " search or --polish-best over",
+                        type=int,
+                        default=1)
+    parser.add_argument("-m", "--migrate",
+                        help="Copy the keys in {} into the --store before"
+                             " doing anything else".format(CHECKED_FILE),
+                        action="store_true")
+    parser.add_argument("-s", "--store",
+                        help="How checked keys are stored. json rewrites"
+                             " {} every run, binary appends to {}, sqlite"
+                             " keeps an indexed database in {}, bloom keeps"
+                             " only the --top-k keys plus a Bloom filter in"
+                             " {}".format(
+                                 CHECKED_FILE, BINARY_FILE, SQLITE_FILE,
+                                 BLOOM_FILE
+                             ),
+                        choices=("json", "binary", "sqlite", "bloom"),
+                        default="json")
+    parser.add_argument("--top-k",
+                        help="Number of best keys --store bloom keeps",
+                        type=int,
+                        default=10000)
+    parser.add_argument("--bloom-capacity",
+                        help="Number of keys a new --store bloom filter is"
+                             " sized for",
+                        type=int,
+                        default=int(1e7))
+    parser.add_argument("--false-positive-rate",
+                        help="False positive rate of a new --store bloom"
+                             " filter once it reaches capacity",
+                        type=float,
+                        default=1e-3)
+    parser.add_argument("--seed",
+                        help="Seed for the random number generators, to"
+                             " repeat a run exactly. Workers get their own"
+                             " streams spawned from it",
+                        type=int)
     parser.add_argument("-w", "--show-words-only",
                         help="When examining results, show only the full words"
                              " that made up the score",
@@ -47,7 +193,22 @@ def main():
     args = parser.parse_args()
 
     # Always start by checking the saved keys
-    checked_keys = json.load(open(CHECKED_FILE, "r"))
+    if args.store == "binary":
+        checked_keys = store.BinaryKeyStore(BINARY_FILE)
+    elif args.store == "sqlite":
+        checked_keys = store.SQLiteKeyStore(SQLITE_FILE)
+    elif args.store == "bloom":
+        checked_keys = store.BoundedKeyStore(
+            top_k=args.top_k,
+            capacity=args.bloom_capacity,
+            error_rate=args.false_positive_rate,
+            path=BLOOM_FILE,
+        )
+    else:
+        checked_keys = util.load_checked_keys(CHECKED_FILE)
+
+    if args.migrate and args.store != "json":
+        checked_keys.update(util.load_checked_keys(CHECKED_FILE))
 
     if args.examine_results:
         # Get the top N results
@@ -55,49 +216,167 @@ def main():
             util.get_ranked_keys(checked_keys, number=args.number_to_examine)
 
         # And display them in a number of ways
-        for key, score in zip(ranked_keys, scores):
-            if args.show_words_only:
-                print(util.get_english_words(key))
-            else:
-                print(util.display_key(key, score=score))
+        if args.show_words_only:
+            displayed = map(util.get_english_words, ranked_keys)
+        else:
+            displayed = util.display_keys(ranked_keys, scores)
+        for text in displayed:
+            print(text)
             print("")
 
     elif args.output_best_guess:
-        util.check_characters_with_image(data.CHARACTERS,
-                                         data.ASSUMED,
-                                         mapping=dict(data.PRESUMED_ANSWER))
+        # Imported here so that nothing else waits on loading cv2
+        import render
+        render.check_characters_with_image(data.CHARACTERS,
+                                           data.ASSUMED,
+                                           mapping=dict(data.PRESUMED_ANSWER))
+
+    elif args.contact_sheet:
+        import render
+        ranked_keys, _ = \
+            util.get_ranked_keys(checked_keys, number=args.number_to_examine)
+        render.write_contact_sheet(data.CHARACTERS, data.ASSUMED, ranked_keys)
+
+    elif args.interactive:
+        if args.polish_key:
+            start = literal_eval(args.polish_key)
+        else:
+            ranked_keys, _ = util.get_ranked_keys(checked_keys, number=1)
+            start = ranked_keys[0] or ()
+        interactive.KeyShell(scoring.WordTable(data.WORD_SET),
+                             start,
+                             checked_keys).cmdloop()
+        if args.store == "json":
+            util.save_checked_keys(checked_keys, CHECKED_FILE)
 
     else:
+        # Every random stream in the run comes from this one seed
+        seed = numpy.random.SeedSequence(args.seed)
+        rng = numpy.random.default_rng(seed.spawn(1)[0])
         # Load the exponential RNG once
-        RNG = util.sample_exponential()
+        RNG = util.sample_exponential(rng)
 
-        if args.polish_key:
-            util.polish_known_key(RNG=RNG,
-                                  checked_keys=checked_keys,
-                                  words=data.WORD_SET,
-                                  key=literal_eval(args.polish_key))
+        # Optionally narrow down the letters each character can be
+        domains = None
+        if args.domains:
+            domains = scoring.character_domains(
+                scoring.WordTable(data.WORD_SET)
+            )
+
+        if args.anneal:
+            start = literal_eval(args.polish_key) if args.polish_key else ()
+            result = search.anneal(rng=rng,
+                                   table=scoring.WordTable(data.WORD_SET),
+                                   key=start,
+                                   n_steps=args.anneal_steps,
+                                   t_start=args.anneal_temperature,
+                                   domains=domains)
+            util.check_key(checked_keys, data.WORD_SET, result.key)
+            print("Best key found after {} evaluations".format(
+                result.evaluations
+            ))
+            print(util.display_key(result.key, score=result.score))
 
-        elif args.polish_best:
-            ranked_keys, scores = \
-                util.get_ranked_keys(checked_keys, number=10)
+        elif args.branch_and_bound:
+            ranked_keys, scores = util.get_ranked_keys(checked_keys, number=1)
+            if args.polish_key:
+                start = literal_eval(args.polish_key)
+            elif ranked_keys[0] is not None:
+                start = ranked_keys[0]
+            else:
+                start = ()
+            result = search.branch_and_bound(
+                table=scoring.WordTable(data.WORD_SET),
+                key=util.get_word_pairs(start),
+                best_score=scores[0],
+                max_states=args.max_states,
+                domains=domains,
+            )
+            if result.truncated:
+                print("Stopped after --max-states {} states, the search was"
+                      " not exhaustive".format(result.states))
+            if result.key is None:
+                print("No key beats the best score of {:.4f}".format(
+                    scores[0]
+                ))
+            else:
+                util.check_key(checked_keys, data.WORD_SET, result.key)
+                print(util.display_key(result.key, score=result.score))
+
+        elif args.dictionary_attack:
+            result = search.dictionary_attack(
+                table=scoring.WordTable(data.WORD_SET),
+                number=args.number_to_examine,
+                max_misses=args.max_misses,
+            )
+            print("Explored {} states".format(result.states))
+            for key, score in zip(result.keys, result.scores):
+                util.check_key(checked_keys, data.WORD_SET, key)
+                print(util.display_key(key, score=score))
+                print("")
 
-            for key in ranked_keys:
-                util.polish_known_key(RNG=RNG,
-                                      checked_keys=checked_keys,
-                                      words=data.WORD_SET,
-                                      key=key)
+        elif args.polish_key or args.polish_best:
+            if args.polish_key:
+                ranked_keys = [literal_eval(args.polish_key)]
+            else:
+                ranked_keys, scores = util.get_ranked_keys(
+                    checked_keys, number=args.number_to_polish
+                )
+            ranked_keys = [key for key in ranked_keys if key is not None]
+
+            if args.workers > 1 and not args.exhaustive:
+                parallel.polish_islands(checked_keys,
+                                        ranked_keys,
+                                        workers=args.workers,
+                                        migrations=args.migrations,
+                                        domains=domains,
+                                        seed=seed)
+            else:
+                table = None
+                if args.exhaustive:
+                    table = scoring.WordTable(data.WORD_SET)
+
+                for key in ranked_keys:
+                    polish(RNG, checked_keys, key, table=table,
+                           max_assignments=args.max_assignments,
+                           domains=domains)
+
+        elif args.workers > 1:
+            parallel.random_search(checked_keys,
+                                   number=args.number_to_random_solve,
+                                   workers=args.workers,
+                                   batch_size=BATCH_SIZE,
+                                   domains=domains,
+                                   seed=seed)
 
         else:
-            # Try a number of times
-            for _ in range(args.number_to_random_solve):
-                key = util.generate_random_key(RNG, checked_keys, 26)
+            scorer = scoring.BatchScorer(data.WORD_SET)
+
+            # Try a number of times, in batches so that generation and
+            # scoring are vectorized
+            remaining = args.number_to_random_solve
+            while remaining > 0:
+                keys = util.generate_random_keys(rng,
+                                                 checked_keys,
+                                                 min(BATCH_SIZE, remaining),
+                                                 domains=domains)
+                # No new keys at all means (narrow) domains have been
+                # exhausted
+                if not len(keys):
+                    print("Ran out of new keys to try")
+                    break
+
+                # Scores the keys and adds them to the dictionary checked_keys
+                util.check_keys(checked_keys, scorer, keys)
+                remaining -= len(keys)
 
-                # Scores the key and adds it to the dictionary checked_keys
-                mapped, score = util.check_key(checked_keys, data.WORD_SET, key)
+        # Always end key production by writing the updated dictionary (the
+        # binary store has been appending as it goes)
+        if args.store == "json":
+            util.save_checked_keys(checked_keys, CHECKED_FILE)
 
-        # Always end key production by writing the updated dictionary
-        with open(CHECKED_FILE, "w") as file:
-            json.dump(checked_keys, file)
+    if args.store != "json":
+        checked_keys.close()
 
     if args.ipdb:
         import ipdb; ipdb.set_trace()
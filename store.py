@@ -0,0 +1,421 @@
+#!/usr/bin/python3
+
+import collections.abc
+import hashlib
+import math
+import os
+import sqlite3
+import tempfile
+
+import numpy
+
+import codec
+import util
+
+
+# Fixed width record of a checked key: the packed key (see codec.pack)
+# followed by the score
+RECORD = numpy.dtype([("key", numpy.uint8, (codec.KEY_WIDTH, )),
+                      ("score", "<f8")])
+
+
+class BinaryKeyStore(collections.abc.MutableMapping):
+    """
+    Checked keys stored as an append-only file of fixed width binary records.
+    The existing records are memory-mapped on open, and every key that gets
+    set is appended straight away, so nothing needs rewriting at exit and a
+    crash only loses what hasn't been flushed yet.
+
+    Lookups in the records from the file binary search a sorted copy of
+    their packed keys, so no Python object is made per record. Only keys set
+    since opening are kept in a dictionary.
+
+    Acts like the checked_keys dictionary, {packed key: float score}, and
+    accepts keys in any form codec.pack does. If a key was stored more than
+    once the last score wins.
+    """
+
+    # Number of appended records to buffer before flushing to disk
+    FLUSH_EVERY = 1000
+    # Packed keys as fixed width byte strings, which numpy can sort and
+    # binary search
+    KEY_DTYPE = numpy.dtype("S{}".format(codec.KEY_WIDTH))
+
+    def __init__(self, path):
+        self.path = path
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        # Ignore a partial record at the end (e.g. from a crash mid-write)
+        number = size // RECORD.itemsize
+        if number:
+            self.records = numpy.memmap(path, dtype=RECORD, mode="r",
+                                        shape=(number, ))
+        else:
+            self.records = numpy.zeros(0, dtype=RECORD)
+        # Sorted packed keys of the records and the record each one is the
+        # last copy of, built on first use
+        self._sorted = None
+        self._latest = None
+        # {packed key: score} of the keys set since opening
+        self.appended = {}
+        # Number of those that aren't in the records
+        self._new = 0
+        self._file = open(path, "ab")
+        if size != number * RECORD.itemsize:
+            self._file.truncate(number * RECORD.itemsize)
+        self._unflushed = 0
+
+    def _index(self):
+        """Sort the records' keys, keeping the last copy of each."""
+        if self._sorted is None:
+            keys = numpy.ascontiguousarray(self.records["key"]).view(
+                self.KEY_DTYPE
+            ).ravel()
+            # Stable, so copies of a key stay in the order they were written
+            order = numpy.argsort(keys, kind="stable")
+            keys = keys[order]
+            last = numpy.ones(len(keys), dtype=bool)
+            last[:-1] = keys[1:] != keys[:-1]
+            self._sorted = keys[last]
+            self._latest = order[last]
+        return self._sorted, self._latest
+
+    def _find(self, packed):
+        """Return the record index holding packed, or None."""
+        keys, latest = self._index()
+        # Compared as numpy strings, since bytes lose their trailing zeros
+        # when they come back out of the array
+        query = numpy.array(packed, self.KEY_DTYPE)
+        i = keys.searchsorted(query)
+        if i < len(keys) and keys[i] == query:
+            return latest[i]
+        return None
+
+    def __contains__(self, key):
+        packed = codec.pack(key)
+        return packed in self.appended or self._find(packed) is not None
+
+    def __getitem__(self, key):
+        packed = codec.pack(key)
+        if packed in self.appended:
+            return self.appended[packed]
+        i = self._find(packed)
+        if i is None:
+            raise KeyError(key)
+        return float(self.records["score"][i])
+
+    def __setitem__(self, key, score):
+        packed = codec.pack(key)
+        record = numpy.zeros(1, dtype=RECORD)
+        record["key"] = numpy.frombuffer(packed, dtype=numpy.uint8)
+        record["score"] = score
+        self._file.write(record.tobytes())
+        if packed not in self.appended and self._find(packed) is None:
+            self._new += 1
+        self.appended[packed] = float(score)
+
+        self._unflushed += 1
+        if self._unflushed >= self.FLUSH_EVERY:
+            self.flush()
+
+    def __delitem__(self, key):
+        raise TypeError("BinaryKeyStore is append-only")
+
+    def __iter__(self):
+        return (packed for packed, _ in self.items())
+
+    def __len__(self):
+        return len(self._index()[0]) + self._new
+
+    def items(self):
+        _, latest = self._index()
+        for i in latest:
+            packed = self.records["key"][i].tobytes()
+            if packed not in self.appended:
+                yield packed, float(self.records["score"][i])
+        yield from self.appended.items()
+
+    def flush(self):
+        self._file.flush()
+        self._unflushed = 0
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SQLiteKeyStore(collections.abc.MutableMapping):
+    """
+    Checked keys stored in a local SQLite database. The packed key (see
+    codec.pack) is the primary key and the score column is indexed, so
+    membership checks don't need everything in memory and the top N keys are
+    an indexed query (see top).
+
+    Acts like the checked_keys dictionary, {packed key: float score}, and
+    accepts keys in any form codec.pack does.
+    """
+
+    # Number of writes to batch up in one transaction
+    COMMIT_EVERY = 10000
+
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS keys"
+            " (key BLOB PRIMARY KEY, score REAL NOT NULL) WITHOUT ROWID"
+        )
+        self.connection.execute(
+            "CREATE INDEX IF NOT EXISTS keys_score ON keys (score)"
+        )
+        self.connection.commit()
+        self._uncommitted = 0
+
+    def __contains__(self, key):
+        return self.connection.execute(
+            "SELECT 1 FROM keys WHERE key = ?", (codec.pack(key), )
+        ).fetchone() is not None
+
+    def __getitem__(self, key):
+        row = self.connection.execute(
+            "SELECT score FROM keys WHERE key = ?", (codec.pack(key), )
+        ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def __setitem__(self, key, score):
+        self.connection.execute(
+            "INSERT OR REPLACE INTO keys (key, score) VALUES (?, ?)",
+            (codec.pack(key), float(score))
+        )
+        self._uncommitted += 1
+        if self._uncommitted >= self.COMMIT_EVERY:
+            self.commit()
+
+    def __delitem__(self, key):
+        cursor = self.connection.execute(
+            "DELETE FROM keys WHERE key = ?", (codec.pack(key), )
+        )
+        if cursor.rowcount == 0:
+            raise KeyError(key)
+
+    def __iter__(self):
+        for packed, in self.connection.execute("SELECT key FROM keys"):
+            yield packed
+
+    def __len__(self):
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM keys"
+        ).fetchone()[0]
+
+    def items(self):
+        yield from self.connection.execute("SELECT key, score FROM keys")
+
+    def update(self, other):
+        """Bulk insert from another mapping (e.g. util.load_checked_keys)."""
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO keys (key, score) VALUES (?, ?)",
+            ((codec.pack(key), float(score)) for key, score in other.items())
+        )
+        self.commit()
+
+    def top(self, number):
+        """
+        Get the best scoring keys with an indexed query.
+
+        Returns:
+            list of up to number (packed key, float score) tuples, best first
+        """
+        return self.connection.execute(
+            "SELECT key, score FROM keys ORDER BY score DESC LIMIT ?",
+            (number, )
+        ).fetchall()
+
+    def commit(self):
+        self.connection.commit()
+        self._uncommitted = 0
+
+    # Same interface as BinaryKeyStore
+    flush = commit
+
+    def close(self):
+        self.commit()
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class BloomFilter:
+    """
+    Probabilistic set of packed keys. Membership checks can give false
+    positives (at about error_rate once capacity keys have been added) but
+    never false negatives, in a fixed number of bits.
+    """
+
+    def __init__(self, capacity, error_rate=1e-3):
+        """
+        Arguments:
+            capacity: int, number of keys the filter is sized for
+            error_rate: float, false positive rate at capacity
+        """
+        self.capacity = int(capacity)
+        self.error_rate = error_rate
+        # Standard sizing for the number of bits and hash functions
+        self.size = int(math.ceil(
+            -self.capacity * math.log(error_rate) / math.log(2) ** 2
+        ))
+        self.hashes = max(1, int(round(
+            self.size / self.capacity * math.log(2)
+        )))
+        self.bits = numpy.zeros((self.size + 7) // 8, dtype=numpy.uint8)
+
+    def _positions(self, packed):
+        # Double hashing, positions are h1 + i * h2 for i < hashes
+        digest = hashlib.blake2b(packed, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return numpy.array(
+            [(first + i * second) % self.size for i in range(self.hashes)],
+            dtype=numpy.int64,
+        )
+
+    def add(self, packed):
+        positions = self._positions(packed)
+        numpy.bitwise_or.at(self.bits, positions >> 3,
+                            (1 << (positions & 7)).astype(numpy.uint8))
+
+    def __contains__(self, packed):
+        positions = self._positions(packed)
+        return bool(((self.bits[positions >> 3] >> (positions & 7)) & 1).all())
+
+
+class BoundedKeyStore(collections.abc.MutableMapping):
+    """
+    Checked keys in a fixed amount of memory. Only the best top_k keys are
+    kept exactly, with their scores. Every key is also added to a Bloom
+    filter, so membership checks (as in generate_random_key) remember all of
+    them, at the cost of occasionally thinking a new key has been seen.
+
+    Acts like the checked_keys dictionary, {packed key: float score}, except
+    that only the top keys can be looked up or iterated over. To match that,
+    len() is the number of top keys held. The number of distinct keys ever
+    added (give or take false positives) is the count attribute.
+    """
+
+    def __init__(self, top_k=10000, capacity=int(1e7), error_rate=1e-3,
+                 path=None):
+        """
+        Arguments:
+            top_k: int, number of best keys to keep exactly
+            capacity: int, number of keys the Bloom filter is sized for
+            error_rate: float, Bloom filter false positive rate at capacity
+            path: None, or a .npz file to load from (if it exists) and save
+                to on close. The loaded file's sizes take precedence
+        """
+        self.path = path
+        self.leaderboard = util.Leaderboard(top_k)
+        self.filter = BloomFilter(capacity, error_rate)
+        # Number of distinct keys added, give or take false positives
+        self.count = 0
+        if path is not None and os.path.exists(path):
+            self._load(path)
+
+    def __contains__(self, key):
+        packed = codec.pack(key)
+        return packed in self.leaderboard or packed in self.filter
+
+    def __getitem__(self, key):
+        score = self.leaderboard.get(codec.pack(key))
+        if score is None:
+            raise KeyError(key)
+        return score
+
+    def __setitem__(self, key, score):
+        packed = codec.pack(key)
+        if packed not in self.filter:
+            self.count += 1
+            self.filter.add(packed)
+        self.leaderboard.push(packed, float(score))
+
+    def __delitem__(self, key):
+        raise TypeError("Keys can't be removed from a Bloom filter")
+
+    def __iter__(self):
+        return (key for key, _ in self.items())
+
+    def __len__(self):
+        return len(self.leaderboard)
+
+    def items(self):
+        return self.leaderboard.items()
+
+    def top(self, number):
+        """See SQLiteKeyStore.top, limited to the keys kept exactly."""
+        return self.items()[:number]
+
+    def save(self, path):
+        """
+        Write the store to a .npz file. It's written to a temporary file
+        next to path first and then moved into place, so an interrupted save
+        leaves the previous file as it was.
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.NamedTemporaryFile(dir=directory, suffix=".npz",
+                                         delete=False) as file:
+            try:
+                self._write(file)
+            except BaseException:
+                file.close()
+                os.remove(file.name)
+                raise
+        os.replace(file.name, path)
+
+    def _write(self, file):
+        items = self.leaderboard.items()
+        numpy.savez(
+            file,
+            bits=self.filter.bits,
+            sizes=numpy.array([self.filter.capacity, self.filter.size,
+                               self.filter.hashes, self.count,
+                               self.leaderboard.number]),
+            error_rate=self.filter.error_rate,
+            keys=numpy.array([numpy.frombuffer(packed, dtype=numpy.uint8)
+                              for packed, _ in items],
+                             dtype=numpy.uint8).reshape(
+                                 len(items), codec.KEY_WIDTH
+                             ),
+            scores=numpy.array([score for _, score in items]),
+        )
+
+    def _load(self, path):
+        with numpy.load(path) as loaded:
+            capacity, size, hashes, self.count, top_k = \
+                loaded["sizes"].tolist()
+            self.filter = BloomFilter(capacity, float(loaded["error_rate"]))
+            assert (self.filter.size, self.filter.hashes) == (size, hashes)
+            self.filter.bits = loaded["bits"].copy()
+            self.leaderboard = util.Leaderboard(top_k)
+            for key, score in zip(loaded["keys"], loaded["scores"].tolist()):
+                self.leaderboard.push(key.tobytes(), score)
+
+    def flush(self):
+        if self.path is not None:
+            self.save(self.path)
+
+    def close(self):
+        self.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,54 @@
+#!/usr/bin/python3
+
+from ast import literal_eval
+
+import codec
+import data
+import util
+
+
+def main():
+    test_pack()
+    test_from_string()
+
+
+def test_pack():
+    key = util.generate_random_key(util.sample_exponential(), {}, 20)
+    packed = codec.pack(key)
+    assert isinstance(packed, bytes)
+    assert len(packed) == codec.KEY_WIDTH
+    assert packed[key[0][0]] == codec.LETTER_INDEX[key[0][1]]
+    assert packed.count(codec.UNMAPPED) == codec.KEY_WIDTH - 20
+    # The fixed width has room for every unknown character
+    assert codec.KEY_WIDTH == max(data.UNKNOWN) + 1
+    assert codec.ORDER[:len(data.SET_FREQ_LIST)] == \
+        tuple(data.SET_FREQ_LIST)
+
+    # Every form packs the same way, and packing is idempotent
+    assert codec.pack(str(key)) == packed
+    assert codec.pack(packed) is packed
+    assert codec.pack(key[::-1]) == packed
+    # Round trips
+    assert codec.unpack(packed) == key
+    assert codec.to_string(packed) == str(key)
+    assert codec.unpack(codec.pack(())) == ()
+
+    # Unpacked pairs come out in data.SET_FREQ_LIST order
+    key = codec.unpack(codec.pack(data.SAMPLE_KEY))
+    assert dict(key) == dict(data.SAMPLE_KEY)
+    assert [pair[0] for pair in key] == [
+        character for character in data.SET_FREQ_LIST
+        if character in dict(key)
+    ]
+
+
+def test_from_string():
+    for key in (data.SAMPLE_KEY, data.PRESUMED_ANSWER, (), ((33, "j"), )):
+        assert codec.from_string(str(key)) == key
+        assert codec.from_string(str(key)) == literal_eval(str(key))
+    # Double quotes (as a person might type them) work too
+    assert codec.from_string('((4, "e"), (16, "t"))') == ((4, "e"), (16, "t"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,15 +1,21 @@
 #!/usr/bin/python3
 
 import collections
+import os
+import subprocess
+import sys
+import tempfile
 
 import data
 
 
 def main():
     test_english()
+    test_load_dictionary()
     test_character_number()
     test_words()
     test_keys()
+    test_lazy_derived()
 
 
 def test_english():
@@ -22,6 +28,37 @@ def test_english():
     for bad_word in data.BLACKLIST:
         assert not data.is_english(bad_word)
 
+    # Longer than any word in the word set, so from the full dictionary
+    assert max(data.WORD_LENGTHS) < len("internationally")
+    assert data.is_english("internationally")
+
+
+def test_load_dictionary():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "words")
+        cache = os.path.join(directory, "words.cache")
+        with open(path, "w") as word_file:
+            word_file.write("The\nquick\nbrown\nfox\nfox\nJumps\n")
+
+        assert data.load_dictionary(path=path, cache=cache) == \
+            {"the", "quick", "brown", "fox", "jumps"}
+        assert os.path.exists(cache)
+        # Read back from the cache
+        assert data.load_dictionary(path=path, cache=cache) == \
+            {"the", "quick", "brown", "fox", "jumps"}
+        # A different set of lengths doesn't use the same cache
+        assert data.load_dictionary(lengths=(3, ), path=path, cache=cache) == \
+            {"the", "fox"}
+        assert data.load_dictionary(lengths=(3, ), path=path, cache=cache) == \
+            {"the", "fox"}
+
+        # Changing the dictionary invalidates the cache
+        with open(path, "a") as word_file:
+            word_file.write("dog\n")
+        os.utime(path, ns=(0, 0))
+        assert data.load_dictionary(lengths=(3, ), path=path, cache=cache) == \
+            {"the", "fox", "dog"}
+
 
 def test_character_number():
     """Assert that our unknown characters can be explained by the alphabet."""
@@ -81,6 +118,26 @@ def test_keys():
     assert 2 in mapping
 
 
+def test_lazy_derived():
+    """Nothing derived from CHARACTERS is worked out just by importing."""
+    loaded = subprocess.run(
+        [sys.executable, "-c",
+         "import codec, data, solver\n"
+         "print(' '.join(sorted(set(data._DERIVED) & set(vars(data)))))\n"
+         "print(' '.join(sorted(set(codec._DERIVED) & set(vars(codec)))))"],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    assert loaded.split() == []
+
+    # But they're there when asked for, and only computed once
+    assert data.SET_FREQ_LIST is data.SET_FREQ_LIST
+    assert "SET_FREQ_LIST" in vars(data)
+    try:
+        data.not_a_thing
+        assert False
+    except AttributeError:
+        pass
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,63 @@
+#!/usr/bin/python3
+
+import io
+
+import data
+import interactive
+import scoring
+
+
+def main():
+    test_key_shell()
+
+
+def test_key_shell():
+    table = scoring.WordTable(data.WORD_SET)
+    checked_keys = {}
+    output = io.StringIO()
+    shell = interactive.KeyShell(table, data.PRESUMED_ANSWER, checked_keys,
+                                 stdout=output)
+    start = shell.scorer.key()
+    assert shell.scorer.score == table.score(data.PRESUMED_ANSWER)
+
+    # Edits are rescored and the text is shown again
+    shell.onecmd("swap 4 16")
+    assert shell.scorer.score == table.score(shell.scorer.key())
+    assert shell.scorer.score < table.score(data.PRESUMED_ANSWER)
+    assert output.getvalue().startswith("score: ")
+
+    # Setting a letter that's in use takes it from the other character
+    letter = shell.scorer.mapping[8]
+    shell.onecmd("set 2 {}".format(letter))
+    assert shell.scorer.mapping[2] == letter
+    assert 8 not in shell.scorer.mapping
+    assert shell.scorer.score == table.score(shell.scorer.key())
+
+    # Frozen characters can't change
+    shell.onecmd("freeze 2")
+    mapping = dict(shell.scorer.mapping)
+    shell.onecmd("unset 2")
+    assert shell.scorer.mapping == mapping
+    assert "2 is frozen" in output.getvalue()
+
+    # Bad input is reported without changing anything
+    shell.onecmd("set 99 a")
+    shell.onecmd("set 2")
+    assert shell.scorer.mapping == mapping
+
+    # Undo steps back through every edit
+    for _ in range(3):
+        shell.onecmd("undo")
+    assert shell.scorer.key() == start
+    assert not shell.frozen
+    assert shell.scorer.score == table.score(data.PRESUMED_ANSWER)
+    shell.onecmd("undo")
+    assert output.getvalue().endswith("Nothing to undo\n")
+
+    shell.onecmd("save")
+    assert len(checked_keys) == 1
+    assert shell.onecmd("quit")
+
+
+if __name__ == "__main__":
+    main()
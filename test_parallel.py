@@ -0,0 +1,109 @@
+#!/usr/bin/python3
+
+import codec
+import data
+import parallel
+import util
+
+
+def main():
+    test_random_search()
+    test_polish_islands()
+    test_migrate()
+
+
+def test_random_search():
+    # Start with a key that's already been checked, with a made up score
+    existing = util.generate_random_key(util.sample_exponential(), {}, 26)
+    checked_keys = {codec.pack(existing): -1.0}
+
+    added = parallel.random_search(checked_keys, number=250, workers=2,
+                                   batch_size=40)
+    assert 0 < added <= 250
+    assert len(checked_keys) == added + 1
+    # Existing scores are never overwritten
+    assert checked_keys[codec.pack(existing)] == -1.0
+
+    # Keys come back in the usual format with the usual scores
+    for packed, score in list(checked_keys.items())[1:20]:
+        assert isinstance(packed, bytes)
+        assert isinstance(score, float)
+        key = codec.unpack(packed)
+        assert len(key) == len(data.UNKNOWN)
+        assert score == util.score_key(util.map_words(data.WORD_SET, key),
+                                       key)
+
+    # A fixed seed gives the same keys, whatever the number of workers
+    runs = []
+    for workers in (1, 2):
+        checked_keys = {}
+        parallel.random_search(checked_keys, number=100, workers=workers,
+                               batch_size=30, seed=7)
+        runs.append(checked_keys)
+    assert runs[0] == runs[1]
+    assert list(runs[0]) == list(runs[1])
+
+
+def test_polish_islands():
+    RNG = util.sample_exponential()
+    keys = [util.generate_random_key(RNG, {}, 26) for _ in range(3)]
+    scores = [util.score_key(util.map_words(data.WORD_SET, key), key)
+              for key in keys]
+
+    checked_keys = {}
+    islands = parallel.polish_islands(checked_keys, keys, workers=2,
+                                      n_depth=4, n_breadth=10, migrations=1)
+    assert len(islands) == 3
+    # Each round of each island checks depth * breadth keys, minus any
+    # duplicates between islands
+    assert 0 < len(checked_keys) <= 3 * 4 * 10
+
+    # Migration keeps every island on a different key, so an island can end
+    # up below where it started, but never the best of them
+    assert max(score for _, score in islands) >= max(scores)
+    for key, score in islands:
+        assert score == util.score_key(util.map_words(data.WORD_SET, key),
+                                       key)
+        assert codec.pack(key) in checked_keys or key in keys
+
+    # Without migration, islands never end up worse than where they started
+    islands = parallel.polish_islands({}, keys, workers=2, n_depth=2,
+                                      n_breadth=5)
+    for (_, score), start in zip(islands, scores):
+        assert score >= start
+
+    # Islands skip keys that were checked before they started. With these
+    # domains the answer is the only key there is to make
+    parallel._initialize_polish(
+        {codec.pack(data.PRESUMED_ANSWER): 1.0},
+        {character: {letter} for character, letter in data.PRESUMED_ANSWER}
+    )
+    checked, _, _ = parallel._polish_island((((4, "e"), ), 2, 2, None))
+    assert checked == {}
+
+    # Seeded runs repeat exactly
+    runs = []
+    for _ in range(2):
+        checked_keys = {}
+        runs.append((parallel.polish_islands(checked_keys, keys, workers=2,
+                                             n_depth=2, n_breadth=5,
+                                             migrations=1, seed=3),
+                     checked_keys))
+    assert runs[0] == runs[1]
+
+
+def test_migrate():
+    a, b, c, d = (((4, letter), ) for letter in "abcd")
+    islands = [(a, 0.1), (b, 0.3), (c, 0.2)]
+    # The last island wants b from its neighbour, which the middle island
+    # keeps, and its own c has gone to the first island. So it falls back on
+    # the next best key it found
+    assert parallel._migrate(islands, [[], [], [(c, 0.2), (d, 0.15)]]) == \
+        [(c, 0.2), (b, 0.3), (d, 0.15)]
+    # Only doubling up when there's nothing else
+    assert parallel._migrate(islands, [[], [], []]) == \
+        [(c, 0.2), (b, 0.3), (b, 0.3)]
+
+
+if __name__ == "__main__":
+    main()
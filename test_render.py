@@ -0,0 +1,135 @@
+#!/usr/bin/python3
+
+import glob
+import os
+import subprocess
+import sys
+import tempfile
+
+import cv2
+import numpy
+
+import codec
+import data
+import render
+import util
+
+
+def main():
+    render.check_characters_with_image(data.CHARACTERS,
+                                       data.ASSUMED,
+                                       mapping=dict(data.SAMPLE_KEY))
+    test_images()
+    test_glyph_atlas()
+    test_render_characters()
+    test_render_contact_sheet()
+    test_lazy_import()
+
+
+def test_images():
+    """Check that the images are within the size range."""
+    for image_name in glob.glob("images/*.png"):
+        image = cv2.imread(image_name)
+        if image.shape[0] > render.SHAPE[0] or \
+                image.shape[1] > render.SHAPE[1]:
+            raise ValueError(
+                "Image {} too big: {} > {}".format(
+                    image_name, image.shape, render.SHAPE
+                )
+            )
+        if image.shape[2] != 3:
+            raise ValueError(
+                "Image {} is not in color image format".format(image_name)
+            )
+
+
+def test_glyph_atlas():
+    atlas = render.load_atlas()
+    # Loaded once and reused
+    assert render.load_atlas() is atlas
+    assert atlas.pixels.dtype == numpy.uint8
+    assert len(atlas.glyphs) == len(glob.glob("images/*.png"))
+    for character in data.UNKNOWN:
+        assert (atlas.glyph(character) ==
+                cv2.imread("images/image_{}.png".format(character))).all()
+
+
+def test_render_characters():
+    atlas = render.load_atlas()
+    mapping = dict(data.SAMPLE_KEY)
+    image = render.render_characters(data.CHARACTERS, data.ASSUMED, mapping)
+    assert image.dtype == numpy.uint8
+    # Cropped to a margin of whitespace on the right and bottom (the last
+    # drawn row and column count towards the margin)
+    assert (image[1 - render.MARGIN:] == 255).all()
+    assert (image[:, 1 - render.MARGIN:] == 255).all()
+    assert (image[-render.MARGIN] != 255).any()
+    assert (image[:, -render.MARGIN] != 255).any()
+
+    # The first character image goes in the top left, centered vertically
+    first = atlas.glyph(data.CHARACTERS[0])
+    y = (render.SHAPE[0] - first.shape[0]) // 2
+    assert (image[y:y + first.shape[0], :first.shape[1]] == first).all()
+
+    # Only the text changes with the mapping
+    unmapped = render.render_characters(data.CHARACTERS, data.ASSUMED)
+    assert unmapped.shape[1] == image.shape[1]
+    assert (unmapped[:render.SHAPE[0]] == image[:render.SHAPE[0]]).all()
+    assert not (unmapped[render.SHAPE[0]:render.SHAPE[0] + render.LINE_BUFFER]
+                == image[render.SHAPE[0]:render.SHAPE[0] +
+                         render.LINE_BUFFER]).all()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "check.png")
+        render.check_characters_with_image(data.CHARACTERS, data.ASSUMED,
+                                           mapping, path=path)
+        assert (cv2.imread(path) == image).all()
+
+
+def test_render_contact_sheet():
+    mapping = dict(data.SAMPLE_KEY)
+    single = render.render_characters(data.CHARACTERS, data.ASSUMED, mapping)
+    sheet = render.render_contact_sheet(data.CHARACTERS, data.ASSUMED,
+                                        [mapping])
+    assert (sheet == single).all()
+
+    # Each line gets a text row per key, in order, under one set of glyphs
+    unmapped = render.render_characters(data.CHARACTERS, data.ASSUMED)
+    sheet = render.render_contact_sheet(data.CHARACTERS, data.ASSUMED,
+                                        [mapping, None])
+    width = min(sheet.shape[1], single.shape[1])
+    line = render.SHAPE[0] + render.LINE_BUFFER
+    assert (sheet[:line, :width] == single[:line, :width]).all()
+    assert (sheet[line:line + render.LINE_BUFFER, :width] ==
+            unmapped[render.SHAPE[0]:line, :width]).all()
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "sheet.png")
+        render.write_contact_sheet(data.CHARACTERS, data.ASSUMED,
+                                   [codec.pack(data.SAMPLE_KEY), None, ()],
+                                   path)
+        assert (cv2.imread(path) == sheet).all()
+
+
+def test_lazy_import():
+    """util only loads the rendering code (and cv2) when it's asked for."""
+    loaded = subprocess.run(
+        [sys.executable, "-c",
+         "import sys, solver; print('cv2' in sys.modules)"],
+        check=True, capture_output=True, text=True,
+    ).stdout
+    assert loaded.strip() == "False"
+
+    # The old names still work through util
+    assert util.SHAPE is render.SHAPE
+    assert util.check_characters_with_image is \
+        render.check_characters_with_image
+    try:
+        util.not_a_thing
+        assert False
+    except AttributeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+#!/usr/bin/python3
+
+import numpy
+
+import data
+import scoring
+import util
+
+
+def main():
+    test_keys_to_array()
+    test_batch_scorer()
+    test_word_pattern()
+    test_pattern_index()
+    test_word_table()
+    test_character_index()
+    test_incremental_scorer()
+    test_upper_bound()
+    test_character_domains()
+
+
+def full_score(key):
+    """Score a key the original way, with util.score_key."""
+    return util.score_key(util.map_words(data.WORD_SET, key), key)
+
+
+def varied_keys():
+    """Return a variety of partial and complete keys to compare scores on."""
+    RNG = util.sample_exponential()
+    keys = [data.SAMPLE_KEY, data.PRESUMED_ANSWER, ()]
+    keys.extend(util.generate_random_key(RNG, {}, length)
+                for length in range(1, 27))
+    keys.extend(util.generate_random_key(RNG, {}, 26, frozen=(
+                    data.PRESUMED_ANSWER[:length]
+                ))
+                for length in range(1, 24))
+    return keys
+
+
+def test_keys_to_array():
+    keys = [data.SAMPLE_KEY, data.PRESUMED_ANSWER, ()]
+    array = scoring.keys_to_array(keys)
+    assert array.shape == (3, scoring.KEY_WIDTH)
+    assert array.dtype == numpy.uint8
+    assert array[0, 2] == 0
+    assert array[0, 1] == 19
+    assert array[0, 3] == scoring.UNMAPPED
+    assert (array[2] == scoring.UNMAPPED).all()
+
+    # Going back should give the same pairs, in frequency order
+    for key, round_trip in zip(keys, scoring.array_to_keys(array)):
+        assert dict(key) == dict(round_trip)
+        assert [pair[0] for pair in round_trip] == [
+            character for character in data.SET_FREQ_LIST
+            if character in dict(key)
+        ]
+
+
+def test_batch_scorer():
+    # Compare against score_key for a variety of partial and complete keys
+    keys = varied_keys()
+    scorer = scoring.BatchScorer(data.WORD_SET, chunk_size=7)
+    scores = scorer.score(scoring.keys_to_array(keys))
+    assert scores.shape == (len(keys), )
+    for key, score in zip(keys, scores):
+        assert score == full_score(key)
+
+    # thud, plus a non-word
+    words = ((33, 21, 4, 8), (33, 4, 21))
+    key = ((33, "t"), (21, "h"), (4, "u"), (8, "d"))
+    scorer = scoring.BatchScorer(words)
+    assert numpy.isclose(scorer.score(scoring.keys_to_array([key]))[0], 0.5)
+
+
+def test_word_pattern():
+    assert scoring.word_pattern("illithid") == (0, 1, 1, 0, 2, 3, 0, 4)
+    assert scoring.word_pattern("a") == (0, )
+    assert scoring.word_pattern("") == ()
+    # Cipher words work the same way
+    assert scoring.word_pattern((16, 19, 7, 7, 4, 16, 16)) == \
+        (0, 1, 2, 2, 3, 0, 0)
+    assert scoring.word_pattern((16, 19, 7, 7, 4, 16, 16)) == \
+        scoring.word_pattern("success")
+
+
+def test_pattern_index():
+    index = scoring.PatternIndex(["the", "and", "too", "see", "illithid"])
+    assert index.candidates((1, 12, 4)) == {"the", "and"}
+    assert index.candidates((1, 8, 8)) == {"too", "see"}
+    assert index.candidates((14, 10, 10, 14, 1, 12, 14, 6)) == {"illithid"}
+    assert index.candidates((8, 8, 1)) == set()
+
+
+def test_word_table():
+    table = scoring.WordTable(data.WORD_SET)
+    assert len(table.words) == len(data.WORD_SET)
+    for word, candidates in zip(table.words, table.candidates):
+        for candidate in candidates:
+            assert len(candidate) == len(word)
+            assert data.is_english(candidate)
+
+    # Compare against score_key for a variety of partial and complete keys
+    for key in varied_keys():
+        assert table.score(key) == full_score(key)
+
+
+def test_character_index():
+    words = ((1, 2, 3), (3, 4), (1, 1, 5))
+    index = scoring.character_index(words)
+    assert index == {1: (0, 2), 2: (0, ), 3: (0, 1), 4: (1, ), 5: (2, )}
+    index = scoring.character_index(words, indices=(1, 2))
+    assert index == {1: (2, ), 3: (1, ), 4: (1, ), 5: (2, )}
+
+
+def test_incremental_scorer():
+    table = scoring.WordTable(data.WORD_SET)
+
+    scorer = scoring.IncrementalScorer(table, data.PRESUMED_ANSWER)
+    assert scorer.score == full_score(data.PRESUMED_ANSWER)
+    assert dict(scorer.key()) == dict(data.PRESUMED_ANSWER)
+
+    # Make a series of moves and check against a full rescore each time
+    RNG = numpy.random.default_rng(4)
+    characters = sorted(data.UNKNOWN)
+    for _ in range(200):
+        first, second = RNG.choice(characters, size=2, replace=False)
+        score = scorer.swap(int(first), int(second))
+        assert score == full_score(scorer.key())
+
+        character = int(RNG.choice(characters))
+        unused = sorted(set("abcdefghijklmnopqrstuvwxyz") -
+                        set(scorer.mapping.values()))
+        score = scorer.assign(character, str(RNG.choice(unused)))
+        assert score == full_score(scorer.key())
+
+    # Unmapping and swapping with an unmapped character
+    scorer.assign(4, None)
+    assert 4 not in scorer.mapping
+    assert scorer.score == full_score(scorer.key())
+    letter = scorer.mapping[16]
+    scorer.swap(4, 16)
+    assert scorer.mapping[4] == letter
+    assert 16 not in scorer.mapping
+    assert scorer.score == full_score(scorer.key())
+
+    # Can't map two characters to the same letter
+    try:
+        scorer.assign(16, letter)
+        assert False
+    except ValueError:
+        pass
+
+
+def test_upper_bound():
+    table = scoring.WordTable(data.WORD_SET)
+    score = table.score(data.PRESUMED_ANSWER)
+    # Complete keys are bounded by their own score
+    assert table.upper_bound(data.PRESUMED_ANSWER) == score
+    # Partial keys are bounded by the score of anything that extends them
+    for length in range(len(data.PRESUMED_ANSWER)):
+        bound = table.upper_bound(data.PRESUMED_ANSWER[:length])
+        assert bound >= score
+        assert bound >= table.score(data.PRESUMED_ANSWER[:length])
+    # A word mapped to non-English is lost for good
+    words = ((1, 12, 4), (14, 5))
+    table = scoring.WordTable(words, index=scoring.PatternIndex(["the", "in"]))
+    assert table.upper_bound(()) == 1.0
+    assert table.upper_bound(((1, "t"), (12, "h"), (4, "y"))) == 0.5
+    # Taking the letters a word needs also rules it out
+    assert table.upper_bound(((1, "i"), )) == 0.0
+
+
+def test_character_domains():
+    # "the", "eat" and "to" only fit together one way
+    words = ((1, 2, 3), (3, 4, 1), (1, 5))
+    index = scoring.PatternIndex(["the", "eat", "dog", "to"])
+    table = scoring.WordTable(words, index=index)
+    domains = scoring.character_domains(table, tolerance=0)
+    assert domains == {1: {"t"}, 2: {"h"}, 3: {"e"}, 4: {"a"}, 5: {"o"}}
+
+    # With some tolerance, one disagreeing word isn't enough to rule out "e"
+    domains = scoring.character_domains(table, tolerance=1)
+    assert "e" in domains[1]
+
+    # Characters in the key are fixed
+    domains = scoring.character_domains(table, key=((5, "q"), ), tolerance=0)
+    assert domains[5] == {"q"}
+    # That rules out "to", so the last word stops constraining 1
+    assert domains[1] == {"t", "e"}
+
+    # The presumed answer should survive on the real words
+    table = scoring.WordTable(data.WORD_SET)
+    domains = scoring.character_domains(table)
+    for character, letter in data.PRESUMED_ANSWER:
+        assert letter in domains[character]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/python3
+
+import itertools
+
+import numpy
+
+import data
+import scoring
+import search
+from test_scoring import full_score
+
+
+def main():
+    test_anneal()
+    test_dictionary_attack()
+    test_branch_and_bound()
+    test_exhaustive_polish()
+
+
+def test_anneal():
+    table = scoring.WordTable(data.WORD_SET)
+    target = table.score(data.PRESUMED_ANSWER)
+
+    # Scramble a few pairs of the answer and make sure we find our way back
+    mapping = dict(data.PRESUMED_ANSWER)
+    mapping[4], mapping[16] = mapping[16], mapping[4]
+    mapping[2], mapping[14] = mapping[14], mapping[2]
+    del mapping[1]
+    start = tuple(mapping.items())
+    assert table.score(start) < target
+
+    # Start cool, since we're already close
+    result = search.anneal(numpy.random.default_rng(0), table, start,
+                           n_steps=int(2e4), t_start=0.005, target=target)
+    assert result.score >= target
+    assert result.score == full_score(result.key)
+    assert 0 < result.evaluations <= int(2e4)
+    # The result should be a valid one-to-one key
+    letters = [pair[1] for pair in result.key]
+    assert len(letters) == len(set(letters))
+
+    # Characters that aren't allowed to move stay put
+    result = search.anneal(numpy.random.default_rng(1), table, start,
+                           n_steps=1000, characters=(4, 16))
+    assert dict(result.key)[2] == mapping[2]
+    assert dict(result.key)[14] == mapping[14]
+    assert set(dict(result.key)) == set(mapping)
+
+
+def test_dictionary_attack():
+    # A tiny puzzle where only the/eat (or eat/the) fit together
+    words = ((1, 2, 3), (3, 4, 1))
+    index = scoring.PatternIndex(["the", "eat", "dog", "god", "aa"])
+    table = scoring.WordTable(words, index=index)
+    result = search.dictionary_attack(table, number=5, max_misses=0)
+    assert result.scores == [1.0, 1.0]
+    solutions = sorted(tuple(dict(key)[character] for character in range(1, 5))
+                       for key in result.keys)
+    assert solutions == [("e", "a", "t", "h"), ("t", "h", "e", "a")]
+    for key in result.keys:
+        # Keys are completed with the remaining letters
+        assert len(key) == len(data.UNKNOWN)
+        letters = [pair[1] for pair in key]
+        assert len(letters) == len(set(letters))
+
+    # Frozen pairs are respected
+    result = search.dictionary_attack(table, max_misses=0, frozen=((1, "t"), ))
+    assert len(result.keys) == 1
+    assert dict(result.keys[0])[3] == "e"
+
+    # The real puzzle, checked for consistency rather than exact results
+    table = scoring.WordTable(data.WORD_SET)
+    result = search.dictionary_attack(table, number=3, max_states=500)
+    assert result.states <= 500
+    assert result.scores == sorted(result.scores, reverse=True)
+    for key, score in zip(result.keys, result.scores):
+        assert score == full_score(key)
+
+
+def test_branch_and_bound():
+    table = scoring.WordTable(data.WORD_SET)
+    target = table.score(data.PRESUMED_ANSWER)
+
+    # Drop the most common characters and search for them again
+    result = search.branch_and_bound(table, data.PRESUMED_ANSWER[6:],
+                                     best_score=target - 0.05)
+    assert result.score >= target
+    assert result.score == full_score(result.key)
+    for pair in data.PRESUMED_ANSWER[6:]:
+        assert pair in result.key
+    assert not result.truncated
+    assert result.evaluations <= result.states
+
+    # Nothing can beat a perfect score
+    result = search.branch_and_bound(table, data.PRESUMED_ANSWER[6:],
+                                     best_score=1.0)
+    assert result.key is None
+    assert result.score == 1.0
+
+    # A state limit cuts the search short and says so
+    result = search.branch_and_bound(table, (), max_states=50)
+    assert result.truncated
+    assert result.states == 50
+
+
+def test_exhaustive_polish():
+    table = scoring.WordTable(data.WORD_SET)
+
+    # Scramble the first few characters and freeze the rest
+    frozen = data.PRESUMED_ANSWER[4:]
+    mapping = dict(data.PRESUMED_ANSWER)
+    mapping[4], mapping[16], mapping[2] = mapping[16], mapping[2], mapping[4]
+    key = tuple(mapping.items())
+    result = search.exhaustive_polish(table, key, frozen)
+    assert result.score == table.score(data.PRESUMED_ANSWER)
+    assert result.score == full_score(result.key)
+    for pair in frozen:
+        assert pair in result.key
+
+    # Compare against brute force over every assignment
+    characters = [pair[0] for pair in data.PRESUMED_ANSWER[:4]]
+    letters = set("abcdefghijklmnopqrstuvwxyz") - \
+        set(pair[1] for pair in frozen)
+    assert len(letters) == 6
+    scores = [table.score(frozen + tuple(zip(characters, permutation)))
+              for permutation in itertools.permutations(sorted(letters), 4)]
+    assert result.score == max(scores)
+    # Only the 6!/2! ways to give 4 characters letters are scored
+    assert result.evaluations == len(scores) == 360
+
+    # Domains narrow the assignments down
+    domains = {character: {letter} for character, letter in
+               data.PRESUMED_ANSWER[:4]}
+    result = search.exhaustive_polish(table, key, frozen, domains=domains)
+    assert result.evaluations == 1
+    assert result.score == table.score(data.PRESUMED_ANSWER)
+
+    # Too many assignments
+    try:
+        search.exhaustive_polish(table, key, frozen, max_assignments=359)
+        assert False
+    except ValueError:
+        pass
+    # Or none at all
+    try:
+        search.exhaustive_polish(table, key, frozen,
+                                 domains={4: {"e"}, 16: {"e"}, 2: {"e"}})
+        assert False
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/python3
+
+import os
+import tempfile
+
+import codec
+import data
+import store
+import util
+
+
+def main():
+    test_binary_key_store()
+    test_sqlite_key_store()
+    test_bloom_filter()
+    test_bounded_key_store()
+
+
+def test_binary_key_store():
+    RNG = util.sample_exponential()
+    keys = [util.generate_random_key(RNG, {}, 26) for _ in range(50)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "keys.bin")
+
+        with store.BinaryKeyStore(path) as checked_keys:
+            assert len(checked_keys) == 0
+            for i, key in enumerate(keys):
+                checked_keys[str(key)] = i / 100
+            # Works the same way as the dictionary with check_key
+            util.check_key(checked_keys, data.WORD_SET, data.SAMPLE_KEY)
+            assert str(keys[3]) in checked_keys
+            assert checked_keys[str(keys[3])] == 0.03
+        assert os.path.getsize(path) == 51 * store.RECORD.itemsize
+
+        # Reopen and make sure everything is still there, and that appending
+        # more keeps going
+        with store.BinaryKeyStore(path) as checked_keys:
+            assert len(checked_keys) == 51
+            for i, key in enumerate(keys):
+                assert str(key) in checked_keys
+                assert checked_keys[str(key)] == i / 100
+            assert data.SAMPLE_KEY in checked_keys
+            assert str(((4, "z"), )) not in checked_keys
+            checked_keys[str(keys[0])] = 0.9
+            ranked_keys, scores = util.get_ranked_keys(checked_keys, 2)
+            assert ranked_keys == [keys[0], keys[49]]
+            assert scores == [0.9, 0.49]
+
+        # A partially written record (like after a crash) is dropped
+        with open(path, "ab") as file:
+            file.write(b"\x01\x02\x03")
+        with store.BinaryKeyStore(path) as checked_keys:
+            assert len(checked_keys) == 51
+            assert checked_keys[str(keys[0])] == 0.9
+            checked_keys[str(keys[1])] = 0.8
+        with store.BinaryKeyStore(path) as checked_keys:
+            assert checked_keys[str(keys[1])] == 0.8
+            assert len(checked_keys) == 51
+            assert dict(checked_keys.items())[codec.pack(keys[0])] == 0.9
+            # Lookups answered from the file don't build a dictionary
+            assert not checked_keys.appended
+
+            # Packed keys ending in zero bytes (an "a") keep them
+            checked_keys[((33, "a"), )] = 0.7
+            checked_keys[((33, "b"), )] = 0.6
+        with store.BinaryKeyStore(path) as checked_keys:
+            assert checked_keys[((33, "a"), )] == 0.7
+            assert checked_keys[((33, "b"), )] == 0.6
+            assert ((21, "a"), ) not in checked_keys
+            assert codec.pack(((33, "a"), )) in set(checked_keys)
+
+
+def test_sqlite_key_store():
+    RNG = util.sample_exponential()
+    keys = [util.generate_random_key(RNG, {}, 26) for _ in range(50)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "keys.sqlite")
+
+        with store.SQLiteKeyStore(path) as checked_keys:
+            assert len(checked_keys) == 0
+            # Migrate in the same format as the JSON file
+            checked_keys.update({str(key): i / 100
+                                 for i, key in enumerate(keys)})
+            assert len(checked_keys) == 50
+            util.check_key(checked_keys, data.WORD_SET, data.SAMPLE_KEY)
+            assert len(checked_keys) == 51
+
+        with store.SQLiteKeyStore(path) as checked_keys:
+            assert len(checked_keys) == 51
+            for i, key in enumerate(keys):
+                assert str(key) in checked_keys
+                assert checked_keys[str(key)] == i / 100
+            assert str(((4, "z"), )) not in checked_keys
+
+            # Overwriting a key replaces it
+            checked_keys[str(keys[0])] = 0.9
+            assert len(checked_keys) == 51
+            assert checked_keys.top(3) == [(codec.pack(keys[0]), 0.9),
+                                           (codec.pack(keys[49]), 0.49),
+                                           (codec.pack(keys[48]), 0.48)]
+            ranked_keys, scores = util.get_ranked_keys(checked_keys, 2)
+            assert ranked_keys == [keys[0], keys[49]]
+            assert scores == [0.9, 0.49]
+
+            del checked_keys[str(keys[0])]
+            assert str(keys[0]) not in checked_keys
+
+
+def test_bloom_filter():
+    RNG = util.sample_exponential()
+    keys = set(codec.pack(util.generate_random_key(RNG, {}, 26))
+               for _ in range(4000))
+    keys = sorted(keys)
+    added, others = keys[:2000], keys[2000:]
+
+    bloom = store.BloomFilter(capacity=2000, error_rate=0.01)
+    for packed in added:
+        bloom.add(packed)
+    # No false negatives
+    for packed in added:
+        assert packed in bloom
+    # Roughly the right false positive rate
+    false_positives = sum(packed in bloom for packed in others)
+    assert false_positives < 0.03 * len(others)
+
+
+def test_bounded_key_store():
+    RNG = util.sample_exponential()
+    keys = [util.generate_random_key(RNG, {}, 26) for _ in range(200)]
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "keys.npz")
+
+        with store.BoundedKeyStore(top_k=5, capacity=1000, path=path) \
+                as checked_keys:
+            for i, key in enumerate(keys):
+                checked_keys[str(key)] = i / 1000
+            # len() agrees with iteration, count has every key
+            assert len(checked_keys) == len(list(checked_keys)) == 5
+            assert 190 < checked_keys.count <= 200
+            # Every key is remembered, only the top keys have scores
+            for key in keys:
+                assert str(key) in checked_keys
+            assert checked_keys[str(keys[-1])] == 0.199
+            try:
+                checked_keys[str(keys[0])]
+                assert False
+            except KeyError:
+                pass
+            ranked_keys, scores = util.get_ranked_keys(checked_keys, 3)
+            assert ranked_keys == keys[-1:-4:-1]
+            assert scores == [0.199, 0.198, 0.197]
+
+        # Reloading keeps both parts
+        with store.BoundedKeyStore(path=path) as checked_keys:
+            for key in keys:
+                assert str(key) in checked_keys
+            assert len(list(checked_keys.items())) == 5
+            assert util.get_ranked_keys(checked_keys, 1)[1] == [0.199]
+            count = checked_keys.count
+
+            # A save that fails part way leaves the old file alone
+            checked_keys["(4, 'z')"] = 0.5
+            write = checked_keys._write
+
+            def interrupted(file):
+                file.write(b"partial")
+                raise KeyboardInterrupt
+
+            checked_keys._write = interrupted
+            try:
+                checked_keys.save(path)
+                assert False
+            except KeyboardInterrupt:
+                pass
+            assert os.listdir(directory) == ["keys.npz"]
+            assert store.BoundedKeyStore(path=path).count == count
+            checked_keys._write = write
+        with store.BoundedKeyStore(path=path) as checked_keys:
+            assert checked_keys.count == count + 1
+
+
+if __name__ == "__main__":
+    main()
@@ -2,45 +2,35 @@
 
 from ast import literal_eval
 import collections
-import glob
 import json
+import os
+import tempfile
 
-import cv2
 import numpy
 
+import codec
 import data
+import scoring
 import util
 
 
 def main():
-    util.check_characters_with_image(data.CHARACTERS,
-                                     data.ASSUMED,
-                                     mapping=dict(data.SAMPLE_KEY))
-    test_images()
     # test_exponential()
+    test_sample_truncated_exponential()
     test_check_key()
+    test_verdict_memo()
+    test_word_list_edits()
     test_map_words()
     # test_display_key()
+    test_decode_lines()
+    test_display_keys()
     # test_display_words()
     test_get_word_pairs()
     test_get_ranked_keys()
+    test_save_checked_keys()
+    test_leaderboard()
     test_generate_random_key()
-
-
-def test_images():
-    """Check that the images are within the size range."""
-    for image_name in glob.glob("images/*.png"):
-        image = cv2.imread(image_name)
-        if image.shape[0] > util.SHAPE[0] or image.shape[1] > util.SHAPE[1]:
-            raise ValueError(
-                "Image {} too big: {} > {}".format(
-                    image_name, image.shape, util.SHAPE
-                )
-            )
-        if image.shape[2] != 3:
-            raise ValueError(
-                "Image {} is not in color image format".format(image_name)
-            )
+    test_generate_random_keys()
 
 
 def test_exponential():
@@ -63,6 +53,22 @@ def test_exponential():
             assert count > lesser_count
 
 
+def test_sample_truncated_exponential():
+    rng = numpy.random.default_rng(0)
+    samples = util.sample_truncated_exponential(rng, (3, int(1e5)))
+    assert samples.shape == (3, int(1e5))
+    assert samples.min() >= 0.0
+    assert samples.max() <= 1.0
+    # Mean of an exponential with scale 0.2 truncated to 0.0-1.0
+    mean = 0.2 - numpy.exp(-5) / (1 - numpy.exp(-5))
+    assert numpy.isclose(samples.mean(), mean, atol=1e-3)
+
+    # Seeded generators give the same samples
+    assert (util.sample_truncated_exponential(numpy.random.default_rng(1), 5)
+            == util.sample_truncated_exponential(numpy.random.default_rng(1),
+                                                 5)).all()
+
+
 def test_map_characters():
     # 40, 41, and 42 have assumed values
     characters = (1, 2, 3, 4, 22, 40, 41, 42)
@@ -101,9 +107,8 @@ def test_check_key():
     assert isinstance(score, float)
     assert numpy.isclose(score, 1.0)
     assert checked_keys == {
-        str(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
+        codec.pack(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
     }
-    json.dumps(checked_keys)
 
     # monstrous regiment
     words = ((33, 21, 4, 8, 15, 30, 21, 19, 8), (30, 2, 6, 13, 33, 2, 4, 15))
@@ -115,11 +120,10 @@ def test_check_key():
                       ("r", "e", "g", "i", "m", "e", "n", "t"))
     assert numpy.isclose(score, 1.0)
     assert checked_keys == {
-        str(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
-        str(((33, "m"), (21, "o"), (4, "n"), (8, "s"), (15, "t"),
+        codec.pack(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
+        codec.pack(((33, "m"), (21, "o"), (4, "n"), (8, "s"), (15, "t"),
              (30, "r"), (19, "u"), (2, "e"), (6, "g"), (13, "i"))): 1.0,
     }
-    json.dumps(checked_keys)
 
     # Same words, but taking out "o"
     key = ((33, "m"), (4, "n"), (8, "s"), (15, "t"),
@@ -130,13 +134,12 @@ def test_check_key():
                       ("r", "e", "g", "i", "m", "e", "n", "t"))
     assert numpy.isclose(score, 0.5)
     assert checked_keys == {
-        str(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
-        str(((33, "m"), (21, "o"), (4, "n"), (8, "s"), (15, "t"),
+        codec.pack(((33, "t"), (21, "h"), (4, "u"), (8, "d"))): 1.0,
+        codec.pack(((33, "m"), (21, "o"), (4, "n"), (8, "s"), (15, "t"),
              (30, "r"), (19, "u"), (2, "e"), (6, "g"), (13, "i"))): 1.0,
-        str(((33, "m"), (4, "n"), (8, "s"), (15, "t"),
+        codec.pack(((33, "m"), (4, "n"), (8, "s"), (15, "t"),
              (30, "r"), (19, "u"), (2, "e"), (6, "g"), (13, "i"))): 0.5,
     }
-    json.dumps(checked_keys)
 
     # Same words, but taking out "t"
     # Also, wipe the checked_keys and assert it's not persistent
@@ -149,10 +152,51 @@ def test_check_key():
                       ("r", "e", "g", "i", "m", "e", "n", 15))
     assert numpy.isclose(score, 0.0)
     assert checked_keys == {
-        str(((33, "m"), (21, "o"), (4, "n"), (8, "s"),
+        codec.pack(((33, "m"), (21, "o"), (4, "n"), (8, "s"),
              (30, "r"), (19, "u"), (2, "e"), (6, "g"), (13, "i"))): 0.0,
     }
-    json.dumps(checked_keys)
+
+
+def test_verdict_memo():
+    words = data.WORD_SET
+    memo = util.VerdictMemo(words)
+    assert memo.cache_info() == (0, len(words), len(words))
+    for key in [data.SAMPLE_KEY, data.PRESUMED_ANSWER, data.SAMPLE_KEY,
+                data.SAMPLE_KEY, data.SAMPLE_KEY[:-1], ()]:
+        assert memo.update(key) == util.score_key(util.map_words(words, key),
+                                                  key)
+        assert tuple(memo.mapped) == util.map_words(words, key)
+
+    # Scoring the same key again doesn't look at any word
+    info = memo.cache_info()
+    memo.update(())
+    assert memo.cache_info() == (info.hits + len(words), info.misses,
+                                 len(words))
+
+
+def test_word_list_edits():
+    words = (("t", "h", "e"), )
+    key = (("t", "t"), ("h", "h"), ("e", "e"))
+    assert util.score_words(words, key) == 1.0
+
+    # Edits through data.edit_word_lists show up straight away
+    data.edit_word_lists(blacklist=["the"])
+    try:
+        assert util.score_words(words, key) == 0.0
+    finally:
+        data.edit_word_lists(blacklist=["the"], remove=True)
+    assert util.score_words(words, key) == 1.0
+
+    # Editing the sets directly needs an invalidation to show up
+    data.BLACKLIST.add("the")
+    try:
+        assert util.score_words(words, key) == 1.0
+        util.invalidate_verdicts()
+        assert util.score_words(words, key) == 0.0
+    finally:
+        data.BLACKLIST.remove("the")
+        util.invalidate_verdicts()
+    assert util.score_words(words, key) == 1.0
 
 
 def test_display_key():
@@ -163,6 +207,36 @@ def test_display_key():
     print(util.display_key(data.SAMPLE_KEY, include_characters=False, score=1))
 
 
+def test_decode_lines():
+    # 40 is " ", 43 is "\n" and 44 is "."
+    characters = (5, 44, 40, 16, 43, 44, 44, 3)
+    lines = list(util.cipher_lines(characters))
+    assert lines == [(5, 44, 40, 16), (44, 44, 3)]
+
+    key = ((5, "a"), )
+    assert list(util.decode_lines(lines, key)) == ["a. ?", "..?"]
+    # The include_characters formatting works within each line
+    assert list(util.decode_lines(lines, key, include_characters=True)) == \
+        ["a   16.", "..3."]
+
+    # Lines come out as the characters come in
+    decoded = util.decode_lines(util.cipher_lines(iter(characters)), key)
+    assert next(decoded) == "a. ?"
+
+
+def test_display_keys():
+    keys = [data.SAMPLE_KEY, ()]
+    for include_characters in (False, True):
+        assert list(util.display_keys(keys, [1.0, 0.5],
+                                      include_characters)) == [
+            util.display_key(data.SAMPLE_KEY, include_characters, 1.0),
+            util.display_key((), include_characters, 0.5),
+        ]
+    displayed = util.display_key(data.SAMPLE_KEY)
+    assert displayed.startswith("Unexplained characters:\n")
+    assert displayed.count("\n") == 3 + data.CHARACTERS.count(43)
+
+
 def test_display_words():
     print(util.get_english_words(data.SAMPLE_KEY))
 
@@ -206,6 +280,61 @@ def test_get_ranked_keys():
                            ((3, 'a'), (6, 'z'))]
     assert scores == [0.75, 0.5, 0.15]
 
+    # And with packed keys, which come back in data.SET_FREQ_LIST order
+    checked_keys = {codec.pack(k): v for k, v in checked_keys.items()}
+    ranked_keys, scores = util.get_ranked_keys(checked_keys, number=3)
+    assert [dict(key) for key in ranked_keys] == [{1: 'a', 5: 'z'},
+                                                  {2: 'a', 4: 'z'},
+                                                  {3: 'a', 6: 'z'}]
+    assert scores == [0.75, 0.5, 0.15]
+
+
+def test_save_checked_keys():
+    checked_keys = {}
+    util.check_key(checked_keys, data.WORD_SET, data.SAMPLE_KEY)
+    util.check_key(checked_keys, data.WORD_SET, data.PRESUMED_ANSWER)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "checked_keys.json")
+        util.save_checked_keys(checked_keys, path)
+        # Stored in the str(key) form, pairs in data.SET_FREQ_LIST order
+        with open(path, "r") as file:
+            assert codec.to_string(codec.pack(data.PRESUMED_ANSWER)) in \
+                json.load(file)
+        assert util.load_checked_keys(path) == checked_keys
+
+
+def test_leaderboard():
+    leaderboard = util.Leaderboard(number=3)
+    # Empty slots come back as None
+    assert leaderboard.ranked() == ([None, None, None], [0.0, 0.0, 0.0])
+
+    leaderboard.push(((1, 'a'), ), 0.5)
+    leaderboard.push(str(((2, 'a'), )), 0.0)
+    leaderboard.push(((3, 'a'), ), 0.25)
+    assert leaderboard.ranked() == ([((1, 'a'), ), ((3, 'a'), ), None],
+                                    [0.5, 0.25, 0.0])
+
+    # Bounded to 3, keeps the earlier key on ties and ignores repeats
+    leaderboard.push(str(((4, 'a'), )), 0.75)
+    leaderboard.push(((5, 'a'), ), 0.25)
+    leaderboard.push(((6, 'a'), ), 0.1)
+    leaderboard.push(((1, 'a'), ), 0.5)
+    assert leaderboard.ranked() == ([((4, 'a'), ), ((1, 'a'), ), ((3, 'a'), )],
+                                    [0.75, 0.5, 0.25])
+
+    # check_key can keep one up to date
+    leaderboard = util.Leaderboard(number=2)
+    words = ((33, 21, 4, 8), )
+    util.check_key({}, words, ((33, "t"), (21, "h"), (4, "u"), (8, "d")),
+                   leaderboard=leaderboard)
+    util.check_key({}, words, ((33, "t"), (21, "h"), (4, "u"), (8, "x")),
+                   leaderboard=leaderboard)
+    assert leaderboard.ranked() == (
+        [((33, "t"), (21, "h"), (4, "u"), (8, "d")), None], [1.0, 0.0]
+    )
+
+
 def test_generate_random_key():
     RNG = util.sample_exponential()
 
@@ -226,7 +355,7 @@ def test_generate_random_key():
     assert "t" in values
 
     # Make a really common key and make sure we don't hit it
-    checked_keys = {str(((4, "e"), (16, "t"))): 0.5}
+    checked_keys = {codec.pack(((4, "e"), (16, "t"))): 0.5}
     for _ in range(int(1e3)):
         key = util.generate_random_key(RNG, checked_keys, 2)
         assert key != ((4, "e"), (16, "t"))
@@ -273,9 +402,96 @@ def test_generate_random_key():
         ]
         assert [pair[0] for pair in key] == sorted_characters
 
+    # Check that letters stay inside the given domains
+    domains = {4: {"e", "q"}, 16: {"t"}, 2: {"x", "y", "z"}}
+    for _ in range(int(1e3)):
+        key = util.generate_random_key(RNG, {}, 3, domains=domains)
+        key_dict = dict(key)
+        assert key_dict[4] in domains[4]
+        assert key_dict[16] == "t"
+        assert key_dict[2] in domains[2]
+
+    # Once every key the constraints allow has been checked, give up rather
+    # than breaking the constraints
+    frozen = ((4, "e"), )
+    checked_keys = {codec.pack(((4, "e"), (16, "t"))): 0.5}
+    assert util.generate_random_key(RNG, checked_keys, 2, frozen=frozen,
+                                    domains={16: {"t"}}, attempts=20) is None
+
+    # And polishing stops there too
+    checked_keys = {}
+    util.polish_known_key(RNG, checked_keys, data.WORD_SET, ((4, "e"), ),
+                          n_depth=3, n_breadth=3, domains={
+                              character: {letter} for character, letter in
+                              data.PRESUMED_ANSWER
+                          })
+    assert len(checked_keys) == 1
+
     # TODO: Make a test where if frozen is too long or duplicates characters
     # we should raise.
 
 
+def test_generate_random_keys():
+    rng = numpy.random.default_rng(0)
+
+    # Keys of the right shape, all unique
+    array = util.generate_random_keys(rng, {}, 2000)
+    assert array.shape == (2000, codec.KEY_WIDTH)
+    assert array.dtype == numpy.uint8
+    keys = [codec.unpack(row.tobytes()) for row in array]
+    assert len(set(keys)) == 2000
+    for key in keys:
+        assert len(key) == len(data.UNKNOWN)
+        assert len(set(letter for _, letter in key)) == len(key)
+
+    # Same distribution as generate_random_key, by how often the most common
+    # cipher character gets each of the most common letters
+    RNG = util.sample_exponential()
+    single = collections.Counter(
+        util.generate_random_key(RNG, {}, 1)[0][1] for _ in range(2000)
+    )
+    batch = collections.Counter(key[0][1] for key in keys)
+    for letter in ("e", "t", "a", "z"):
+        assert abs(single[letter] - batch[letter]) < 100
+
+    # Shorter keys, frozen pairs and domains
+    frozen = ((16, "t"), (8, "o"))
+    domains = {4: {"e", "q"}, 2: {"x", "y", "z"}}
+    array = util.generate_random_keys(rng, {}, 500, length=4, frozen=frozen,
+                                      domains=domains)
+    for row in array:
+        key_dict = dict(codec.unpack(row.tobytes()))
+        assert set(key_dict) == {16, 8, 4, 2}
+        assert key_dict[16] == "t"
+        assert key_dict[8] == "o"
+        assert key_dict[4] in domains[4]
+        assert key_dict[2] in domains[2]
+
+    # Skips keys that have been checked, and stops once they run out rather
+    # than recursing
+    domains = {4: {"e"}, 16: {"t", "s"}}
+    checked_keys = {codec.pack(((4, "e"), (16, "t"))): 0.5}
+    array = util.generate_random_keys(rng, checked_keys, 10, length=2,
+                                      domains=domains)
+    assert [codec.unpack(row.tobytes()) for row in array] == \
+        [((4, "e"), (16, "s"))]
+
+    # The same seed gives the same keys
+    assert (util.generate_random_keys(numpy.random.default_rng(5), {}, 50) ==
+            util.generate_random_keys(numpy.random.default_rng(5), {}, 50)
+            ).all()
+
+    # And feeds straight into batch scoring
+    checked_keys = {}
+    scorer = scoring.BatchScorer(data.WORD_SET)
+    array = util.generate_random_keys(rng, checked_keys, 100)
+    scores = util.check_keys(checked_keys, scorer, array)
+    assert len(checked_keys) == 100
+    for row, score in zip(array, scores):
+        key = codec.unpack(row.tobytes())
+        assert score == util.score_key(util.map_words(data.WORD_SET, key),
+                                       key)
+
+
 if __name__ == "__main__":
     main()
@@ -1,133 +1,79 @@
 #!/usr/bin/python3
 
-from ast import literal_eval
 import collections
-import cv2
+import heapq
+import itertools
+import json
 import numpy
 import string
+from operator import itemgetter
 
+import codec
 import data
-
-
-# The maximum size each individual character can be
-SHAPE = (90, 70, 3)
-# The height to allow for cv2.putText
-TEXT_BUFFER = 40
-# The height to allow for each row of character + text
-LINE_BUFFER = TEXT_BUFFER + 10
-# Tracks the current spot where we are inserting characters
-Cursor = collections.namedtuple('Cursor', ['x', 'ymin', 'ymax'])
-
-
-def check_characters_with_image(characters, assumed, mapping=None):
+import scoring
+
+
+# Number of word collections that keep their VerdictMemo, see verdict_memo
+MAX_MEMOS = 8
+# Number of keys generate_random_key samples before deciding that every key
+# it's allowed to make has been checked
+MAX_ATTEMPTS = 1000
+# Names that moved to render.py, which is only imported (along with cv2) when
+# one of them is used
+RENDER_NAMES = ("SHAPE", "TEXT_BUFFER", "LINE_BUFFER", "Cursor",
+                "check_characters_with_image", "calculate_y_edge")
+# What VerdictMemo.cache_info returns
+VerdictInfo = collections.namedtuple("VerdictInfo",
+                                     ["hits", "misses", "size"])
+# {id(words): VerdictMemo}, oldest first, see verdict_memo
+_memos = collections.OrderedDict()
+
+
+def __getattr__(name):
+    if name in RENDER_NAMES:
+        import render
+        return getattr(render, name)
+    raise AttributeError(
+        "module {!r} has no attribute {!r}".format(__name__, name)
+    )
+
+
+def sample_truncated_exponential(rng, size, scale=0.2):
     """
-    Writes image of stored characters for visual checking. Each line of text is
-    represented as
-        1) A line of the cipher text
-        2) Underneath it, our mapping of cipher to ascii (? by default)
+    Draw exponential samples truncated to 0.0-1.0, by inverting the CDF of the
+    truncated distribution, so every draw gets used (no rejection).
 
     Arguments:
-        mapping: None (in which case all non-assumed characters become "?") or
-            a dictionary of {unknown character (int): ascii}, where the unknown
-            characters are all stored as integers in CHARACTERS. Items in the
-            mapping will be displayed as such under the sipher text.
+        rng: numpy.random.Generator, or None for a freshly seeded one
+        size: int or tuple, shape of the array to return
+        scale: float, scale of the exponential before truncation
 
-    Returns nothing
+    Returns:
+        float array of the given shape, weighted towards 0.0
     """
+    if rng is None:
+        rng = numpy.random.default_rng()
+    # CDF is (1 - exp(-x / scale)) / (1 - exp(-1 / scale)) on 0.0-1.0
+    uniform = rng.random(size)
+    return -scale * numpy.log1p(uniform * numpy.expm1(-1.0 / scale))
 
-    # Note that in image space it goes (y, x), a.k.a. (vertical, horizontal)
-
-    # First make a blank canvas to insert images into
-    image = numpy.ones((70 * (SHAPE[0] + LINE_BUFFER), 70 * SHAPE[1], 3)) * 255
-    # Make a cursor tracking the next position to add a character
-    cursor = Cursor(x=0, ymin=0, ymax=SHAPE[0])
 
-    # Add each character to the image
-    for character in characters:
+def sample_exponential(rng=None):
+    """
+    Generator to get exponential samples one at a time, drawn in batches
+    from sample_truncated_exponential because the random generator is a lot
+    faster per sample that way, compared to one call per sample.
 
-        # If we get a newline, update the cursor. If not, place a character
-        if character in assumed and assumed[character] == "\n":
-            # Zero the x position and bump the height down
-            cursor = Cursor(x=0,
-                            ymin=cursor.ymax + LINE_BUFFER,
-                            ymax=cursor.ymax + LINE_BUFFER + SHAPE[0])
+    Samples are scaled to be *mostly* from 0.0-1.0, and capped at 1.0 so we
+    get an approximate 1/x distribution.
 
-        else:
-            # Load the image for this character. This is probably inefficient,
-            # but since this function is meant for human inspection anyway the
-            # possible lengths won't matter to a computer
-            character_image = cv2.imread(
-                "images/image_{}.png".format(character)
-            )
-
-            # Calculate where the image should be placed vertically so that it
-            # will be centered on the cursor. The character images have
-            # variable heights depending on the character shape
-            character_y_edge = calculate_y_edge(cursor, character_image.shape)
-
-            # Set the character image into the greater image
-            # Note that images are (y, x), where x and y are in the human
-            # expected frame
-            image[character_y_edge:character_y_edge + character_image.shape[0],
-                  cursor.x:cursor.x + character_image.shape[1],
-                  :] = character_image
-
-            # Figure out what we want to map cipher text to, this display it
-            # underneath the cipher representation
-            if character in assumed:
-                text = assumed[character]
-            else:
-                if mapping and character in mapping:
-                    text = mapping[character]
-                else:
-                    text = "?"
-            cv2.putText(
-                img=image,
-                text=text,
-                # WTF - why is putText location in (horizontal, vertical)?
-                org=(cursor.x + character_image.shape[1] // 4,
-                     cursor.ymax + TEXT_BUFFER),
-                fontFace=cv2.FONT_HERSHEY_SIMPLEX,
-                fontScale=1.5,
-                color=(0, 0, 0),
-                thickness=2,
-            )
-
-            # Update the cursor
-            cursor = Cursor(x=cursor.x + character_image.shape[1],
-                            ymin=cursor.ymin,
-                            ymax=cursor.ymax)
-
-    # Figure out where we start hitting blank whitespace, and clip the image
-    where = numpy.argwhere(image != (255, 255, 255))
-    y_edge = max(where[:, 0]) + 20
-    x_edge = max(where[:, 1]) + 20
-    image = image[0:y_edge, 0:x_edge]
-
-    # Write out the image
-    cv2.imwrite("check_text_image.png", image)
-
-
-def calculate_y_edge(cursor, shape):
-    # Get the range and subtract the character size
-    empty = (cursor.ymax - cursor.ymin) - shape[0]
-    return cursor.ymin + int(empty / 2)
-
-
-def sample_exponential():
-    """
-    Generator to get exponential samples. Done in batches because the random
-    generator is a lot faster per sample that way, compared to one call per
-    sample.
-
-    Samples are scaled to be *mostly* from 0.0-1.0, and then samples over 1.0
-    are remove so we get an approximate 1/x distribution, but capped at 1.0
+    Arguments:
+        rng: see sample_truncated_exponential
     """
+    if rng is None:
+        rng = numpy.random.default_rng()
     while True:
-        batch = numpy.random.exponential(scale=0.2, size=int(1e4))
-        for value in batch:
-            if value <= 1.0:
-                yield value
+        yield from sample_truncated_exponential(rng, int(1e4)).tolist()
 
 
 def map_characters(characters, key):
@@ -181,6 +127,128 @@ def map_words(words, key):
     return tuple(new_words)
 
 
+class VerdictMemo:
+    """
+    English verdicts for each of a fixed collection of words, kept up to
+    date key after key. Only the words containing a character whose letter
+    differs from the previous key are mapped and looked up again (as in
+    scoring.IncrementalScorer), the rest keep their verdict. Unlike
+    scoring.WordTable the scores are exactly score_key's for any key.
+    """
+
+    def __init__(self, words):
+        """
+        Arguments:
+            words: see map_words
+        """
+        # Words in the order map_words gives them, which for a set is its
+        # iteration order
+        self.source = words
+        self.words = tuple(words)
+        # Fetch the letters of a word out of a key dictionary, raising
+        # KeyError if any character is unmapped (see scoring.WordTable)
+        self.getters = tuple(itemgetter(*word) for word in self.words)
+        # {cipher character: indices of the words containing it}
+        self.containing = collections.defaultdict(set)
+        for i, word in enumerate(self.words):
+            for character in word:
+                self.containing[character].add(i)
+        self.containing = dict(self.containing)
+        self.clear()
+
+    def clear(self):
+        """Forget every verdict and reset the counts."""
+        self.version = data.WORD_LISTS_VERSION
+        self.hits = self.misses = 0
+        self.mapping = {}
+        self.mapped = list(self.words)
+        self.verdicts = [False] * len(self.words)
+        self.count = 0
+        self._recheck(range(len(self.words)))
+
+    def update(self, key):
+        """
+        Move on to a new key. Starts over if data.edit_word_lists has been
+        called since the last key.
+
+        Arguments:
+            key: see map_words
+
+        Returns:
+            float, see score_key. self.mapped and self.verdicts hold the
+            mapped words and their verdicts
+        """
+        if self.version != data.WORD_LISTS_VERSION:
+            self.clear()
+        mapping = dict(key)
+        affected = set()
+        # Pairs in only one of the keys are the characters that changed
+        for character, _ in mapping.items() ^ self.mapping.items():
+            affected.update(self.containing.get(character, ()))
+        self.mapping = mapping
+        self._recheck(affected)
+        self.hits += len(self.words) - len(affected)
+        return self.count / len(self.words)
+
+    def _recheck(self, indices):
+        """Map and look up the given words again under self.mapping."""
+        mapping = self.mapping
+        mapped = self.mapped
+        verdicts = self.verdicts
+        for i in indices:
+            try:
+                letters = self.getters[i](mapping)
+            except KeyError:
+                # Not fully mapped, so not English without needing a lookup
+                mapped[i] = tuple(mapping.get(character, character)
+                                  for character in self.words[i])
+                verdict = False
+            else:
+                mapped[i] = tuple(letters)
+                verdict = data.is_english("".join(letters))
+            self.count += verdict - verdicts[i]
+            verdicts[i] = verdict
+        self.misses += len(indices)
+
+    def cache_info(self):
+        """
+        Returns:
+            VerdictInfo, the number of word verdicts kept from the previous
+            key (hits) and looked up again (misses), and the number of words
+        """
+        return VerdictInfo(self.hits, self.misses, len(self.words))
+
+
+def verdict_memo(words):
+    """
+    Get the VerdictMemo for a collection of words, made on first use. Memos
+    are found by the identity of words, which is cheaper than hashing them,
+    and only the MAX_MEMOS most recently made are kept.
+    """
+    memo = _memos.get(id(words))
+    if memo is None or memo.source is not words:
+        memo = _memos[id(words)] = VerdictMemo(words)
+        if len(_memos) > MAX_MEMOS:
+            _memos.popitem(last=False)
+    return memo
+
+
+def invalidate_verdicts():
+    """
+    Forget every cached verdict. Only needed after editing data.BLACKLIST or
+    data.KNOWN_GOOD directly, data.edit_word_lists takes care of it.
+    """
+    _memos.clear()
+
+
+def score_words(words, key):
+    """
+    Same as score_key(map_words(words, key), key), but through the
+    VerdictMemo of words, so only the words key changes are looked at again.
+    """
+    return verdict_memo(words).update(key)
+
+
 def score_key(mapped, key):
     """
     Calculate the score by the number of English words.
@@ -204,15 +272,17 @@ def score_key(mapped, key):
     return count / len(mapped)
 
 
-def check_key(checked_keys, words, key):
+def check_key(checked_keys, words, key, leaderboard=None):
     """
     Scores a given key by ranking the fraction of English in words created
     by the key, then stores that mapping in checked_keys.
 
     Arguments:
-        checked_keys: dict, contains {tuple key: float score}
+        checked_keys: dict, contains {packed key: float score}, see
+            codec.pack
         words: see map_words
         key: see map_words
+        leaderboard: None, or a Leaderboard to offer the scored key to
 
     Returns:
         mapped: see map_words return value
@@ -221,62 +291,167 @@ def check_key(checked_keys, words, key):
     Note that the dictionary checked_keys is modified
     """
 
-    # Switch characters we know we want to map
-    mapped = map_words(words, key)
-
-    # Get the score in a reliable way
-    score = score_key(mapped, key)
+    # Get the score in a reliable way, only looking again at the words that
+    # changed since the last key scored against these words
+    memo = verdict_memo(words)
+    score = memo.update(key)
+    mapped = tuple(memo.mapped)
 
-    # Record the checked key and its score. Note that we have to set the keys
-    # to be strings so we can jsonify them
-    checked_keys[str(key)] = score
+    # Record the checked key and its score. Keys are packed to keep lookups
+    # fast and memory small, see save_checked_keys for the JSON form
+    checked_keys[codec.pack(key)] = score
+    if leaderboard is not None:
+        leaderboard.push(key, score)
 
     return mapped, score
 
 
-def display_key(key, include_characters=False, score=None):
-    """Render a key onto the whole dataset."""
-    mapped = list(map_characters(data.CHARACTERS, key))
-    for idx in range(len(mapped)):
-        if not isinstance(mapped[idx], str):
-            removed = mapped.pop(idx)
-            if include_characters:
-                mapped.insert(idx, ".{}.".format(removed))
-            else:
-                mapped.insert(idx, "?")
+def check_keys(checked_keys, scorer, keys, leaderboard=None):
+    """
+    Batch version of check_key. Scores all of the given keys in one call and
+    stores them in checked_keys.
+
+    Arguments:
+        checked_keys: see check_key
+        scorer: scoring.BatchScorer, built on the words we want to score
+        keys: list of keys, see map_words, or an array of packed keys as from
+            generate_random_keys
+        leaderboard: None, or a Leaderboard to offer the scored keys to
 
-    # Do some visual formatting in the include_characters case
-    joined = "".join(mapped)
-    if include_characters:
-        joined = joined.replace("..", ".")
-        joined = joined.replace(" .", " ").replace(". ", " ")
-        joined = joined.replace(" ", "   ")
+    Returns:
+        (N,) float array of scores, in the same order as keys
 
-    # Get a common ending
-    postfix = "Unexplained characters:\n{}\n{}\n".format(
-        unexplained_letters(key), key
-    ) + joined
+    Note that the dictionary checked_keys is modified
+    """
+    if isinstance(keys, numpy.ndarray):
+        array = keys
+    else:
+        array = scoring.keys_to_array(keys)
+    scores = scorer.score(array)
+    for row, score in zip(array, scores):
+        packed = row.tobytes()
+        checked_keys[packed] = float(score)
+        if leaderboard is not None:
+            leaderboard.push(packed, float(score))
+    return scores
+
+
+class _DecodeTable(dict):
+    """
+    {cipher character: text it decodes to} for one key, filled in the first
+    time each character is looked up.
+    """
+
+    def __init__(self, key, include_characters):
+        super().__init__()
+        self.mapping = dict(key)
+        self.include_characters = include_characters
+
+    def __missing__(self, character):
+        if character in data.ASSUMED:
+            text = data.ASSUMED[character]
+        elif character in self.mapping:
+            text = self.mapping[character]
+        elif self.include_characters:
+            text = ".{}.".format(character)
+        else:
+            text = "?"
+        self[character] = text
+        return text
+
+
+def cipher_lines(characters):
+    """
+    Split cipher text into lines at the assumed newline characters.
+
+    Arguments:
+        characters: iterable of ciphertext characters (integers)
+
+    Yields:
+        tuple of the characters in each line, without the newline
+    """
+    line = []
+    for character in characters:
+        if data.ASSUMED.get(character) == "\n":
+            yield tuple(line)
+            line = []
+        else:
+            line.append(character)
+    yield tuple(line)
+
+
+def decode_lines(lines, key, include_characters=False):
+    """
+    Decode lines of cipher text (see cipher_lines) with a key, one line at a
+    time, so long texts can be streamed.
+
+    Arguments:
+        lines: iterable of tuples of ciphertext characters
+        key: tuple of tuple pairs containing (cipher character, ascii)
+        include_characters: bool, show unmapped characters as .N. rather
+            than ?
 
+    Yields:
+        str, each decoded line without the newline
+    """
+    table = _DecodeTable(key, include_characters)
+    for line in lines:
+        joined = "".join(map(table.__getitem__, line))
+        # Do some visual formatting in the include_characters case. None of
+        # the patterns hold a newline, so formatting line by line matches
+        # formatting the whole text at once
+        if include_characters:
+            joined = joined.replace("..", ".")
+            joined = joined.replace(" .", " ").replace(". ", " ")
+            joined = joined.replace(" ", "   ")
+        yield joined
+
+
+def _display_header(key, score=None):
+    header = "Unexplained characters:\n{}\n{}\n".format(
+        unexplained_letters(key), key
+    )
     if score is None:
-        return postfix
+        return header
     else:
-        return "score: {:.4f}\n".format(score) + postfix
+        return "score: {:.4f}\n".format(score) + header
 
 
-def get_english_words(key):
-    """Return a set of only the full words that went into the score."""
-    words = set()
-    mapped = map_words(data.WORD_SET, key)
+def display_key(key, include_characters=False, score=None):
+    """Render a key onto the whole dataset."""
+    return _display_header(key, score) + "\n".join(
+        decode_lines(cipher_lines(data.CHARACTERS), key, include_characters)
+    )
 
-    for word in mapped:
-        try:
-            string_word = "".join(word)
-            if data.is_english(string_word):
-                words.add(string_word)
-        except TypeError:
-            pass
 
-    return words
+def display_keys(keys, scores=None, include_characters=False):
+    """
+    Render many keys onto the whole dataset, splitting the cipher text into
+    lines only once.
+
+    Arguments:
+        keys: list of keys, as for display_key
+        scores: None, or a list of float scores matching keys
+
+    Yields:
+        str, the display_key output for each key
+    """
+    lines = list(cipher_lines(data.CHARACTERS))
+    if scores is None:
+        scores = [None] * len(keys)
+    for key, score in zip(keys, scores):
+        yield _display_header(key, score) + "\n".join(
+            decode_lines(lines, key, include_characters)
+        )
+
+
+def get_english_words(key):
+    """Return a set of only the full words that went into the score."""
+    memo = verdict_memo(data.WORD_SET)
+    memo.update(key)
+    return set("".join(word)
+               for word, verdict in zip(memo.mapped, memo.verdicts)
+               if verdict)
 
 
 def unexplained_letters(key):
@@ -304,41 +479,132 @@ def get_word_pairs(key):
 RankedKey = collections.namedtuple('RankedKey', ['key', 'score'])
 
 
+class Leaderboard:
+    """
+    Tracks the top N keys as they are scored, in a heap bounded to N entries,
+    so the cost of ranking doesn't grow with the number of keys checked.
+
+    Follows the same rules get_ranked_keys always has: a key has to score
+    above 0.0 (and above the current worst when the board is full) to get on
+    it, and on a tie the key that got there first ranks higher.
+    """
+
+    def __init__(self, number=1):
+        assert number >= 1
+        self.number = number
+        # Min-heap of (score, -arrival, key), so the root is the entry that
+        # gets bumped next
+        self._heap = []
+        # {key: score} of the keys currently on the board
+        self._members = {}
+        self._arrivals = itertools.count()
+
+    def __contains__(self, key):
+        return key in self._members
+
+    def __len__(self):
+        return len(self._heap)
+
+    def get(self, key, default=None):
+        """Return the score of a key on the board, or default."""
+        return self._members.get(key, default)
+
+    def push(self, key, score):
+        """
+        Offer a key to the leaderboard.
+
+        Arguments:
+            key: a key, as a tuple, packed (see codec.pack) or in the
+                str(tuple) form
+            score: float
+        """
+        if key in self._members:
+            return
+        entry = (score, -next(self._arrivals), key)
+        if len(self._heap) < self.number:
+            if score > 0.0:
+                heapq.heappush(self._heap, entry)
+                self._members[key] = score
+        elif entry > self._heap[0]:
+            _, _, removed = heapq.heapreplace(self._heap, entry)
+            del self._members[removed]
+            self._members[key] = score
+
+    def items(self):
+        """Return a list of (key, score) pairs, best first, without padding."""
+        return [(key, score) for score, _, key in sorted(self._heap,
+                                                         reverse=True)]
+
+    def ranked(self):
+        """
+        Returns:
+            A tuple of (list of ranked keys, list of corresponding scores),
+            padded with None keys (scored 0.0) up to the leaderboard size.
+            Packed and string keys are converted back into tuples
+        """
+        entries = sorted(self._heap, reverse=True)
+        keys = [_to_tuple(key) for _, _, key in entries]
+        scores = [score for score, _, _ in entries]
+        padding = self.number - len(entries)
+        return keys + [None] * padding, scores + [0.0] * padding
+
+
+def _to_tuple(key):
+    """Convert a key in any of its forms back into a tuple."""
+    if isinstance(key, bytes):
+        return codec.unpack(key)
+    if isinstance(key, str):
+        return codec.from_string(key)
+    return key
+
+
+def load_checked_keys(path):
+    """
+    Read checked keys saved by save_checked_keys (e.g.
+    checked_keys_dictionary.json), where keys are in the str(key) form.
+
+    Returns:
+        dict of {packed key: float score}, see check_key
+    """
+    with open(path, "r") as file:
+        return {codec.pack(key): score
+                for key, score in json.load(file).items()}
+
+
+def save_checked_keys(checked_keys, path):
+    """Write checked keys to a JSON file, keys in the str(key) form."""
+    with open(path, "w") as file:
+        json.dump({codec.to_string(key): score
+                   for key, score in checked_keys.items()}, file)
+
+
 def get_ranked_keys(checked_keys, number=1):
     """
     Get the top N ranked keys from a dictionary.
 
     Arguments:
         checked_keys: a dictionary of keys and scores, as from
-            checked_keys_dictionary.json
+            load_checked_keys, or a store with a top() method
+            (like store.SQLiteKeyStore)
         number: number of ranked scores we want to extract
 
     Returns:
         A tuple of (list of ranked keys, list of corresponding scores)
     """
-    assert number >= 1
-    ranked_keys = [RankedKey(key=None, score=0.0)] * number
-
-    for key, score in checked_keys.items():
-        # If the current score is greater than the least score in the ranked
-        # list, then replace that least score and then resort the list.
-        if score > ranked_keys[-1].score:
-            ranked_keys[-1] = RankedKey(key, score)
-            ranked_keys = sorted(ranked_keys,
-                                 key=lambda x: x.score,
-                                 reverse=True)
+    # Stores with an index on the score can give us the candidates directly
+    if hasattr(checked_keys, "top"):
+        items = checked_keys.top(number)
+    else:
+        items = checked_keys.items()
 
-    # We should work with string keys (for the JSON dump) and for non-string
-    # keys (like in a dynamic key tracking)
-    try:
-        return ([literal_eval(key.key) for key in ranked_keys],
-                [key.score for key in ranked_keys])
-    except ValueError:
-        return ([key.key for key in ranked_keys],
-                [key.score for key in ranked_keys])
+    leaderboard = Leaderboard(number)
+    for key, score in items:
+        leaderboard.push(key, score)
+    return leaderboard.ranked()
 
 
-def generate_random_key(RNG, checked_keys, length, frozen=None):
+def generate_random_key(RNG, checked_keys, length, frozen=None,
+                        domains=None, attempts=MAX_ATTEMPTS):
     """
     Create a random key, sampled from likely letters, of given length.
 
@@ -348,17 +614,34 @@ def generate_random_key(RNG, checked_keys, length, frozen=None):
             preferentially sample letters on the likely side of the frequency
             sorted list
         checked_keys: a dictionary of keys and scores, as from
-            checked_keys_dictionary.json
+            load_checked_keys
         length: int, length of key to create
         frozen: tuple of tuple pairs (like a key) containing cipher and ascii
             pairs that we want to force into the key
+        domains: None, or a dictionary of {cipher character: set of letters}
+            (see scoring.character_domains). If given, each character is only
+            sampled from the remaining letters in its domain (or from all the
+            remaining letters if none of its domain is left)
+        attempts: int, number of keys to sample before giving up on finding
+            one that isn't in checked_keys
 
     Returns:
         A key of the normal format, a tuple of tuple pairs containing
             (cipher character, ascii letter). Should be sorted so that cipher
             characters are in the same order as data.SET_FREQ_LIST, for key
-            comparability
+            comparability. None if every attempt was already checked, which
+            means the keys allowed by frozen and domains are (nearly) used up
     """
+    # If we have a collision, keep trying with the same constraints
+    for _ in range(attempts):
+        key = _sample_key(RNG, length, frozen, domains)
+        if codec.pack(key) not in checked_keys:
+            return key
+    return None
+
+
+def _sample_key(RNG, length, frozen, domains):
+    """Sample one key for generate_random_key, checked or not."""
     key = []
 
     # Make a list of the frequency analyzed letters (cipher and ascii) so that
@@ -387,33 +670,132 @@ def generate_random_key(RNG, checked_keys, length, frozen=None):
     while (len(key) < length and
             len(sample_characters) > 0 and
             len(sample_letters) > 0):
+        character = sample_characters.pop(0)
+        # Restrict the sampled letters to the character's domain
+        eligible = sample_letters
+        if domains is not None and character in domains:
+            eligible = [letter for letter in sample_letters
+                        if letter in domains[character]] or sample_letters
         sample = next(RNG)
-        index = int(round(sample * len(sample_letters))) - 1
-        key.append(
-            (
-                sample_characters.pop(0),
-                sample_letters.pop(index)
-            )
-        )
+        index = int(round(sample * len(eligible))) - 1
+        letter = eligible[index]
+        sample_letters.remove(letter)
+        key.append((character, letter))
 
     # Sort it so the cipher characters are in frequency order (for key
     # comparability)
-    key = sorted(key, key=lambda x: data.SET_FREQ_LIST.index(x[0]))
+    key = sorted(key, key=lambda x: codec.RANK[x[0]])
 
     # Tuplify it to lock it in place and make it dictionaryable
-    key = tuple(key)
+    return tuple(key)
 
-    # If we have a collision, recurse and keep trying. Note that this also
-    # provides a natural limit to the number of attempts, since there is a
-    # recursion limit
-    while str(key) in checked_keys:
-        key = generate_random_key(RNG, checked_keys, length)
 
-    return key
+# Letter indices in frequency order, for generate_random_keys
+LETTER_RANKS = numpy.array([codec.LETTER_INDEX[letter]
+                            for letter in data.ENGLISH_FREQ_LIST],
+                           dtype=numpy.uint8)
+
+
+def generate_random_keys(rng, checked_keys, number, length=26, frozen=None,
+                         domains=None):
+    """
+    Batch version of generate_random_key, building number keys at once as an
+    array of packed keys (see codec.pack) ready for scoring.BatchScorer.
+
+    Letters are sampled the same way as in generate_random_key, one character
+    at a time in data.SET_FREQ_LIST order, but for every key at once. Keys
+    that are already in checked_keys (or repeated within the batch) are
+    dropped and replaced by sampling again, until a round turns up nothing
+    new. So fewer than number keys come back once the keys run out, instead
+    of hitting the recursion limit.
+
+    Arguments:
+        rng: numpy.random.Generator that all of the samples are drawn from
+        checked_keys: see generate_random_key
+        number: int, number of keys to create
+        length: see generate_random_key
+        frozen: see generate_random_key
+        domains: see generate_random_key
+
+    Returns:
+        (M, codec.KEY_WIDTH) uint8 array of new keys, with M <= number
+    """
+    if frozen is None:
+        frozen = ()
+    frozen_characters = set(character for character, _ in frozen)
+    frozen_letters = set(codec.LETTER_INDEX[letter] for _, letter in frozen)
+
+    characters = [character for character in data.SET_FREQ_LIST
+                  if character not in frozen_characters]
+    characters = characters[:max(0, length - len(frozen))]
+    # The letters that are free to be sampled, in frequency order
+    free = ~numpy.isin(LETTER_RANKS, list(frozen_letters))
+    # Letters each character is restricted to, in frequency order
+    restrictions = []
+    for character in characters:
+        if domains is not None and character in domains:
+            restrictions.append(numpy.isin(
+                LETTER_RANKS,
+                [codec.LETTER_INDEX[letter] for letter in domains[character]]
+            ))
+        else:
+            restrictions.append(None)
+    template = numpy.frombuffer(codec.pack(frozen), dtype=numpy.uint8)
+
+    width = codec.KEY_WIDTH
+    new = {}
+    while len(new) < number:
+        size = number - len(new)
+        array = numpy.tile(template, (size, 1))
+        # Letters are along the first axis so that the cumulative sums below
+        # run over contiguous rows
+        available = numpy.repeat(free[:, None], size, axis=1)
+        samples = sample_truncated_exponential(rng, (len(characters), size))
+        columns = numpy.arange(size)
+
+        for step, character in enumerate(characters):
+            eligible = available
+            if restrictions[step] is not None:
+                eligible = available & restrictions[step][:, None]
+                # Fall back on all the remaining letters if none of the
+                # domain is left
+                empty = ~eligible.any(axis=0)
+                eligible[:, empty] = available[:, empty]
+            # Running count of eligible letters. Looping over the 26 rows is
+            # a lot faster than cumsum or argmax along the short axis
+            running = numpy.empty(eligible.shape, dtype=numpy.uint8)
+            numpy.cumsum(eligible[:1], axis=0, out=running[:1])
+            for letter in range(1, len(running)):
+                numpy.add(running[letter - 1], eligible[letter],
+                          out=running[letter])
+            counts = running[-1]
+            # Same indexing as generate_random_key, where -1 wraps around to
+            # the last eligible letter
+            index = (numpy.round(samples[step] * counts).astype(numpy.uint8)
+                     + counts - 1) % counts
+            # The chosen letter is the first whose running count passes index
+            position = numpy.zeros(size, dtype=numpy.intp)
+            for letter in range(len(running)):
+                position += running[letter] <= index
+            available[position, columns] = False
+            array[:, character] = LETTER_RANKS[position]
+
+        found = len(new)
+        packed = array.tobytes()
+        new.update(dict.fromkeys(
+            key for key in (packed[start:start + width]
+                            for start in range(0, len(packed), width))
+            if key not in checked_keys
+        ))
+        if len(new) == found:
+            break
+
+    return numpy.frombuffer(bytearray().join(new),
+                            dtype=numpy.uint8).reshape(-1, width)
 
 
 def polish_known_key(RNG, checked_keys, words, key, n_depth=100,
-                     n_breadth=100):
+                     n_breadth=100, domains=None):
     """
     Try permuting all of the pairs in key that are *not currently* part of an
     English word. The intent is to ignore presumed good stuff and narrow in
@@ -428,25 +810,30 @@ def polish_known_key(RNG, checked_keys, words, key, n_depth=100,
         n_depth: int, number of times to take the latest best key
         n_breadth: int, number of times to try on a given key before moving
             onto the current highest ranked one
+        domains: See generate_random_key docstring
 
-    Returns: Nothing. All that happens is checked_keys is updated
+    Returns: Nothing. All that happens is checked_keys is updated. Stops
+    early if generate_random_key runs out of unchecked keys to make
     """
 
-    # Track the keys generated as part of this endeavor
-    keys = { key: score_key(map_words(words, key), key) }
+    # Track the best key generated as part of this endeavor, so we can get
+    # the top key from our search area instead of from the global pool
+    leaderboard = Leaderboard(number=1)
+    leaderboard.push(key, score_words(words, key))
 
     # Spend a while trying variations on the given key
     for _ in range(n_depth):
-        top_keys, _ = get_ranked_keys(keys, number=1)
-        frozen = get_word_pairs(top_keys[0])
+        top_keys, _ = leaderboard.ranked()
+        frozen = get_word_pairs(top_keys[0] or key)
         for _ in range(n_breadth):
             # Generate a new key with certain values frozen
             new_key = generate_random_key(RNG,
                                           checked_keys,
                                           length=26,
-                                          frozen=frozen)
-            _, score = check_key(checked_keys, words, new_key)
-
-            # Maintain a local structure of tried keys so we can get the top
-            # keys from our search area instead of from the global pool
-            keys[str(new_key)] = score
+                                          frozen=frozen,
+                                          domains=domains)
+            # Every nearby key has been checked, and without a new best key
+            # the frozen pairs won't change, so there's nothing left to try
+            if new_key is None:
+                return
+            check_key(checked_keys, words, new_key, leaderboard=leaderboard)